@@ -1,30 +1,36 @@
 import os
-import re
 import sys
+import csv
 import argparse
 import duckdb
 import time
-from unidecode import unidecode
+import pyarrow as pa
+from pyarrow import csv as pa_csv
 
 
-def is_latin_char_text(text):
-    if not isinstance(text, str):
-        return False
-    for char in text:
-        if '\u0000' <= char <= '\u024F':
-            return True
-    return False
+# Canonical affiliation join key, computed by DuckDB's vectorized string
+# functions: strip accents, lowercase, drop punctuation, trim.
+NORMALIZED_AFFILIATION_KEY_SQL = (
+    "trim(regexp_replace(lower(strip_accents(COALESCE(normalized_affiliation_name, ''))), "
+    r"'[^\p{L}\p{N}_\s]', '', 'g'))"
+)
 
+# Number of buffered import errors that triggers a write to import_errors
+ERROR_FLUSH_SIZE = 1000
 
-def normalize_text(text):
-    if not isinstance(text, str):
-        return text
-    if is_latin_char_text(text):
-        text = unidecode(text)
-    text = text.lower()
-    text = re.sub(r'[^\w\s]', '', text)
-    text = text.strip()
-    return text
+# Rows missing required fields or with implausible lengths are not imported
+VALID_ROW_SQL = """
+    work_id IS NOT NULL 
+    AND work_id != ''
+    AND work_id != 'null'
+    AND author_name IS NOT NULL
+    AND author_name != ''
+    AND LENGTH(work_id) < 1000
+    AND LENGTH(COALESCE(author_name, '')) < 500
+"""
+
+# Number of filtered rows sampled into import_errors
+FILTERED_SAMPLE_SIZE = 100
 
 
 def parse_arguments():
@@ -41,7 +47,7 @@ def parse_arguments():
     parser.add_argument(
         "-r", "--reference-file",
         required=True,
-        help="Path to the reference CSV file with author affiliations."
+        help="Path to the reference CSV (or previously converted .parquet) file with author affiliations."
     )
     parser.add_argument(
         "-d", "--db-file",
@@ -56,7 +62,12 @@ def parse_arguments():
     parser.add_argument(
         "--temp-dir",
         default=None,
-        help="Temporary directory for disk spilling when memory limit is reached."
+        help="Temporary directory for disk spilling when memory limit is reached. Default: DuckDB's own (<db-file>.tmp)"
+    )
+    parser.add_argument(
+        "--max-temp-size",
+        default=None,
+        help="Maximum disk space DuckDB may use for spilling (e.g., '200GB'). Default: DuckDB's own, based on free disk space."
     )
     parser.add_argument(
         "--chunk-size",
@@ -69,6 +80,18 @@ def parse_arguments():
         action="store_true",
         help="Skip index creation (useful for very large datasets where indexes can be created later)."
     )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of DuckDB worker threads for the import. Default: all cores."
+    )
+    parser.add_argument(
+        "--as-parquet",
+        action="store_true",
+        help="Convert the reference CSV to a ZSTD-compressed Parquet file next to it and load from that.\n"
+             "Later builds can pass the .parquet file as --reference-file to skip CSV parsing."
+    )
 
     return parser.parse_args()
 
@@ -79,7 +102,40 @@ def get_file_size_gb(file_path):
     return size_bytes / (1024 ** 3)
 
 
-def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_size=None, skip_indexes=False):
+def is_parquet_file(file_path):
+    return file_path.lower().endswith('.parquet')
+
+
+def convert_to_parquet(con, reference_file):
+    """Convert the reference CSV to Parquet once so later loads skip CSV tokenization"""
+    parquet_file = os.path.splitext(reference_file)[0] + '.parquet'
+    print(f"Converting '{reference_file}' to Parquet at '{parquet_file}'...")
+    # COPY ... TO does not take a bound parameter for its target, so the path
+    # is inlined as a SQL string literal with its quotes doubled
+    escaped_parquet_file = parquet_file.replace("'", "''")
+    con.execute(f"""
+        COPY (
+            SELECT * FROM read_csv_auto(
+                ?,
+                header=true,
+                delim=',',
+                quote='"',
+                escape='"',
+                parallel=true,
+                ignore_errors=true,
+                maximum_line_size=10485760,
+                sample_size=100000,
+                null_padding=true,
+                all_varchar=true
+            )
+        ) TO '{escaped_parquet_file}' (FORMAT PARQUET, COMPRESSION ZSTD);
+    """, [reference_file])
+    print(f"  - Parquet file written ({get_file_size_gb(parquet_file):.2f} GB)")
+    return parquet_file
+
+
+def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_size=None, skip_indexes=False,
+                   as_parquet=False, max_temp_size=None, threads=None):
     print("--- Running Database Setup ---")
     
     if not os.path.exists(reference_file):
@@ -93,14 +149,23 @@ def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_s
     con = duckdb.connect(database=db_file, read_only=False)
     
     print(f"Setting memory limit to {memory_limit}.")
-    con.execute(f"SET memory_limit='{memory_limit}';")
+    con.execute("SET memory_limit=?;", [memory_limit])
     
+    # DuckDB already spills to <db-file>.tmp with a cap based on free disk
+    # space; these only override that when asked
     if temp_dir:
+        os.makedirs(temp_dir, exist_ok=True)
         print(f"Setting temporary directory to '{temp_dir}'.")
-        con.execute(f"SET temp_directory='{temp_dir}';")
+        con.execute("SET temp_directory=?;", [temp_dir])
+    if max_temp_size:
+        print(f"Capping temporary directory size at {max_temp_size}.")
+        con.execute("SET max_temp_directory_size=?;", [max_temp_size])
     
-    # Set single-threaded mode for large file stability
-    con.execute("SET threads=1;")
+    # Use all cores by default; the CSV and Parquet readers are parallel and
+    # memory is bounded by memory_limit, not by single-threading
+    threads = threads or os.cpu_count()
+    print(f"Using {threads} threads.")
+    con.execute("SET threads=?;", [threads])
     # Disable insertion order preservation for better memory efficiency
     con.execute("SET preserve_insertion_order=false;")
     
@@ -120,7 +185,13 @@ def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_s
             );
         """)
         
-        if chunk_size:
+        if as_parquet and not is_parquet_file(reference_file):
+            reference_file = convert_to_parquet(con, reference_file)
+        
+        if chunk_size and is_parquet_file(reference_file):
+            print("Parquet input is loaded in a single pass; ignoring --chunk-size.")
+            process_standard(con, reference_file)
+        elif chunk_size:
             # Chunked processing for extremely large files
             print(f"Using chunked processing with chunk size: {chunk_size:,} rows")
             process_chunked(con, reference_file, chunk_size)
@@ -128,34 +199,32 @@ def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_s
             # Standard processing with error handling
             process_standard(con, reference_file)
         
+        # Step 3: Column statistics are collected while the table is written,
+        # so no separate ANALYZE pass is needed. String compression is left
+        # to DuckDB, which picks dictionary or FSST per segment; forcing FSST
+        # made the file larger and scans slower.
+        
         # Step 4: Create indexes for fast lookups (optional)
         if skip_indexes:
             print("Skipping index creation as requested.")
             print("You can create indexes later with:")
-            print("  CREATE INDEX idx_work_id ON author_references (work_id);")
             print("  CREATE INDEX idx_doi ON author_references (doi);")
-            print("  CREATE INDEX idx_norm_name ON author_references (normalized_author_name);")
             print("  CREATE INDEX idx_norm_affil ON author_references (normalized_affiliation_key);")
-            print("  CREATE INDEX idx_ror ON author_references (affiliation_ror);")
         else:
             print("Creating indexes for fast lookups...")
             print("Note: Index creation may take time for large datasets...")
             
-            # Create indexes one at a time with memory cleanup between each
+            # Only the point-equality join keys get ART indexes; work_id,
+            # normalized_author_name and affiliation_ror lookups rely on
+            # vectorized scans with row-group zonemaps instead.
             indexes = [
-                ("idx_work_id", "work_id"),
                 ("idx_doi", "doi"),
-                ("idx_norm_name", "normalized_author_name"),
-                ("idx_norm_affil", "normalized_affiliation_key"),
-                ("idx_ror", "affiliation_ror")
+                ("idx_norm_affil", "normalized_affiliation_key")
             ]
             
             for idx_name, column in indexes:
                 try:
                     print(f"  Creating index on {column}...")
-                    # Force checkpoint and memory cleanup before each index
-                    con.execute("CHECKPOINT;")
-                    con.execute(f"SET memory_limit='{memory_limit}';")  # Re-enforce memory limit
                     con.execute(f"CREATE INDEX IF NOT EXISTS {idx_name} ON author_references ({column});")
                     print(f"    ✓ Index {idx_name} created")
                 except Exception as e:
@@ -164,14 +233,17 @@ def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_s
             
             print("Index creation completed.")
         
-        # Step 5: Display statistics
+        # Step 5: Materialize and display statistics
+        print("Computing database statistics...")
+        build_stats_table(con)
+        
         elapsed_time = time.time() - start_time
         print(f"\nImport completed in {elapsed_time:.2f} seconds ({elapsed_time/60:.2f} minutes)")
         
         # Get final statistics
         stats = con.execute("""
             SELECT 
-                (SELECT COUNT(*) FROM author_references) as final_rows,
+                (SELECT total_rows FROM db_stats) as final_rows,
                 (SELECT COUNT(*) FROM import_errors) as error_rows
         """).fetchone()
         
@@ -187,6 +259,10 @@ def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_s
                 for err in sample_errors:
                     print(f"  - {err[0][:100]}...")
         
+        # Single checkpoint once everything is written; memory pressure during
+        # index builds is left to DuckDB's buffer manager and temp spilling
+        con.execute("CHECKPOINT;")
+        
         print("\nDatabase build is complete!")
         
     except Exception as e:
@@ -196,120 +272,156 @@ def setup_database(db_file, reference_file, memory_limit, temp_dir=None, chunk_s
         con.close()
 
 
+def transform_select_sql(source_sql):
+    """SELECT that cleans, types and filters raw reference rows from source_sql"""
+    return f"""
+        SELECT
+            work_id,
+            CASE 
+                WHEN doi IS NULL OR doi = '' OR doi = 'null' THEN NULL
+                ELSE doi
+            END as doi,
+            TRY_CAST(author_sequence AS INTEGER) as author_sequence,
+            author_name,
+            normalized_author_name,
+            TRY_CAST(affiliation_sequence AS INTEGER) as affiliation_sequence,
+            affiliation_name,
+            normalized_affiliation_name,
+            affiliation_ror,
+            {NORMALIZED_AFFILIATION_KEY_SQL} as normalized_affiliation_key
+        FROM {source_sql}
+        WHERE {VALID_ROW_SQL}
+    """
+
+
+def build_stats_table(con):
+    """Compute all table statistics in one scan and store them in db_stats.
+
+    author_references is immutable once built, so verify_db.py and
+    create_indexes.py read these counts instead of rescanning the table.
+    """
+    con.execute("""
+        CREATE OR REPLACE TABLE db_stats AS
+        SELECT
+            COUNT(*) AS total_rows,
+            COUNT(DISTINCT work_id) AS unique_works,
+            COUNT(DISTINCT author_name) AS unique_authors,
+            COUNT(DISTINCT affiliation_name) AS unique_affiliations,
+            COUNT(DISTINCT affiliation_ror) AS unique_rors,
+            COUNT(*) FILTER (WHERE doi IS NOT NULL) AS rows_with_doi,
+            COUNT(*) FILTER (WHERE affiliation_ror IS NOT NULL) AS rows_with_ror,
+            COUNT(*) FILTER (WHERE work_id IS NULL) AS rows_null_work_id,
+            COUNT(*) FILTER (WHERE author_name IS NULL) AS rows_null_author_name
+        FROM author_references;
+    """)
+
+
 def process_standard(con, reference_file):
     """Standard processing with robust error handling"""
     
-    # Step 2: Import with error tolerance into staging table
-    print("Stage 1: Importing raw data with error tolerance...")
+    # Step 2: Stream CSV/Parquet -> filter -> final table in a single pass.
+    # COPY ... FROM into a typed table uses the same CSV scanner, but would
+    # need a DELETE pass for the row filters and an UPDATE (or a virtual
+    # generated column recomputed on every scan) for the join key.
+    print("Importing, cleaning and transforming data in a single pass...")
     
-    # First, try to create staging table with error handling
-    staging_sql = f"""
-        CREATE OR REPLACE TABLE author_references_staging AS
-        SELECT * FROM read_csv_auto(
-            '{reference_file}',
+    if is_parquet_file(reference_file):
+        reader_sql = "read_parquet(?)"
+    else:
+        reader_sql = """read_csv_auto(
+            ?,
             header=true,
             delim=',',
             quote='"',
             escape='"',
-            parallel=false,
+            parallel=true,
             ignore_errors=true,
             maximum_line_size=10485760,
             sample_size=100000,
             null_padding=true,
             all_varchar=true
-        );
-    """
+        )"""
     
     try:
-        con.execute(staging_sql)
-        
-        # Get row count
-        staging_count = con.execute("SELECT COUNT(*) FROM author_references_staging").fetchone()[0]
-        print(f"  - Loaded {staging_count:,} rows into staging table")
+        con.execute(f"CREATE OR REPLACE TABLE author_references AS {transform_select_sql(reader_sql)};",
+                    [reference_file])
         
     except Exception as e:
+        if is_parquet_file(reference_file):
+            raise
         print(f"Warning: Standard import failed: {e}")
         print("Attempting fallback import method...")
         
         # Fallback: More conservative parameters
-        fallback_sql = f"""
-            CREATE OR REPLACE TABLE author_references_staging AS
-            SELECT * FROM read_csv_auto(
-                '{reference_file}',
+        fallback_reader_sql = """read_csv_auto(
+                ?,
                 header=true,
                 delim=',',
                 parallel=false,
                 all_varchar=true
-            );
-        """
-        con.execute(fallback_sql)
-        staging_count = con.execute("SELECT COUNT(*) FROM author_references_staging").fetchone()[0]
-        print(f"  - Loaded {staging_count:,} rows into staging table (fallback method)")
-    
-    # Step 3: Clean and transform to final table
-    print("Stage 2: Cleaning and transforming data...")
-    
-    transform_sql = """
-        CREATE OR REPLACE TABLE author_references AS
-        SELECT
-            work_id,
-            CASE 
-                WHEN doi IS NULL OR doi = '' OR doi = 'null' THEN NULL
-                ELSE doi
-            END as doi,
-            TRY_CAST(author_sequence AS INTEGER) as author_sequence,
-            author_name,
-            normalized_author_name,
-            TRY_CAST(affiliation_sequence AS INTEGER) as affiliation_sequence,
-            affiliation_name,
-            normalized_affiliation_name,
-            affiliation_ror,
-            lower(trim(COALESCE(normalized_affiliation_name, ''))) as normalized_affiliation_key
-        FROM author_references_staging
-        WHERE work_id IS NOT NULL 
-          AND work_id != ''
-          AND work_id != 'null'
-          AND author_name IS NOT NULL
-          AND author_name != ''
-          AND LENGTH(work_id) < 1000
-          AND LENGTH(COALESCE(author_name, '')) < 500;
-    """
-    
-    con.execute(transform_sql)
+            )"""
+        reader_sql = fallback_reader_sql
+        con.execute(f"CREATE OR REPLACE TABLE author_references AS {transform_select_sql(reader_sql)};",
+                    [reference_file])
     
     # Get final count
     final_count = con.execute("SELECT COUNT(*) FROM author_references").fetchone()[0]
     print(f"  - Final table contains {final_count:,} valid rows")
     
-    # Log any rows that were filtered out
-    skipped = staging_count - final_count
-    if skipped > 0:
-        print(f"  - Filtered out {skipped:,} invalid/incomplete rows")
-        
-        # Log sample of filtered rows for debugging
+    log_filtered_rows(con, reader_sql, reference_file, final_count)
+
+
+def log_filtered_rows(con, reader_sql, reference_file, final_count):
+    """Report how many source rows the transform filtered out and log a sample to import_errors.
+
+    Counting the source costs one more read of it; for Parquet the count
+    comes from file metadata.
+    """
+    source_count = con.execute(f"SELECT COUNT(*) FROM {reader_sql};", [reference_file]).fetchone()[0]
+    skipped = source_count - final_count
+    if skipped <= 0:
+        return
+    
+    print(f"  - Filtered out {skipped:,} invalid/incomplete rows")
+    
+    # The scan stops once the sample is full
+    con.execute(f"""
+        INSERT INTO import_errors (error_message, row_content)
+        SELECT 
+            'Row filtered during transformation: missing required fields or invalid data length',
+            COALESCE(work_id, '') || ',' || COALESCE(doi, '') || ',' || COALESCE(author_name, '')
+        FROM {reader_sql}
+        WHERE NOT ({VALID_ROW_SQL})
+        LIMIT {FILTERED_SAMPLE_SIZE};
+    """, [reference_file])
+
+
+def flush_import_errors(con, errors):
+    """Write accumulated (error_message, row_content) pairs to import_errors in one insert"""
+    if not errors:
+        return
+    error_table = pa.table({
+        'error_message': [msg for msg, _ in errors],
+        'row_content': [content for _, content in errors]
+    })
+    con.register('error_batch', error_table)
+    try:
         con.execute("""
             INSERT INTO import_errors (error_message, row_content)
-            SELECT 
-                'Row filtered during transformation: missing required fields or invalid data length',
-                work_id || ',' || COALESCE(doi, '') || ',' || COALESCE(author_name, '')
-            FROM author_references_staging
-            WHERE work_id IS NULL 
-               OR work_id = ''
-               OR work_id = 'null'
-               OR author_name IS NULL
-               OR author_name = ''
-               OR LENGTH(work_id) >= 1000
-               OR LENGTH(COALESCE(author_name, '')) >= 500
-            LIMIT 100;
+            SELECT error_message, row_content FROM error_batch;
         """)
-    
-    # Clean up staging table to save space
-    con.execute("DROP TABLE author_references_staging;")
-    print("  - Staging table cleaned up")
+    finally:
+        con.unregister('error_batch')
+    errors.clear()
 
 
 def process_chunked(con, reference_file, chunk_size):
-    """Process CSV in chunks for extremely large files"""
+    """Process CSV in chunks for extremely large files.
+
+    The CSV is parsed by PyArrow's streaming reader, which holds one block
+    in memory at a time, so this path works where DuckDB's CSV reader runs
+    out of memory. Each batch is cleaned by the same SQL as the standard path.
+    """
     print(f"Processing CSV in chunks of {chunk_size:,} rows...")
     
     # Create the final table structure first
@@ -328,77 +440,69 @@ def process_chunked(con, reference_file, chunk_size):
         );
     """)
     
-    offset = 0
+    # Read every column as a string, matching all_varchar=true in the standard path
+    with open(reference_file, newline='', encoding='utf-8') as f:
+        header = next(csv.reader(f))
+    
+    # Errors are buffered and written in batches rather than one INSERT each
+    errors = []
+    skipped_rows = 0
+    
+    def skip_invalid_row(row):
+        nonlocal skipped_rows
+        skipped_rows += 1
+        errors.append(("Malformed CSV row", (row.text or '')[:500]))
+        return 'skip'
+    
+    reader = pa_csv.open_csv(
+        reference_file,
+        read_options=pa_csv.ReadOptions(block_size=64 * 1024 * 1024),
+        parse_options=pa_csv.ParseOptions(
+            delimiter=',',
+            newlines_in_values=True,
+            invalid_row_handler=skip_invalid_row
+        ),
+        convert_options=pa_csv.ConvertOptions(
+            column_types={name: pa.string() for name in header},
+            null_values=[''],
+            strings_can_be_null=True
+        )
+    )
+    insert_sql = f"INSERT INTO author_references {transform_select_sql('chunk_batch')};"
+    
     chunk_num = 1
     total_rows = 0
     
-    while True:
-        print(f"Processing chunk {chunk_num} (offset: {offset:,})...")
-        
-        try:
-            # Read chunk with LIMIT and OFFSET
-            chunk_sql = f"""
-                INSERT INTO author_references
-                SELECT
-                    work_id,
-                    CASE 
-                        WHEN doi IS NULL OR doi = '' OR doi = 'null' THEN NULL
-                        ELSE doi
-                    END as doi,
-                    TRY_CAST(author_sequence AS INTEGER) as author_sequence,
-                    author_name,
-                    normalized_author_name,
-                    TRY_CAST(affiliation_sequence AS INTEGER) as affiliation_sequence,
-                    affiliation_name,
-                    normalized_affiliation_name,
-                    affiliation_ror,
-                    lower(trim(COALESCE(normalized_affiliation_name, ''))) as normalized_affiliation_key
-                FROM read_csv_auto(
-                    '{reference_file}',
-                    header=true,
-                    delim=',',
-                    parallel=false,
-                    ignore_errors=true,
-                    all_varchar=true
-                )
-                WHERE work_id IS NOT NULL 
-                  AND work_id != ''
-                  AND work_id != 'null'
-                  AND author_name IS NOT NULL
-                  AND author_name != ''
-                  AND LENGTH(work_id) < 1000
-                  AND LENGTH(COALESCE(author_name, '')) < 500
-                LIMIT {chunk_size}
-                OFFSET {offset};
-            """
-            
-            result = con.execute(chunk_sql)
-            rows_inserted = result.rowcount if hasattr(result, 'rowcount') else chunk_size
-            
-            if rows_inserted == 0:
-                print(f"No more rows to process. Total rows imported: {total_rows:,}")
-                break
-            
-            total_rows += rows_inserted
-            print(f"  - Chunk {chunk_num} completed: {rows_inserted:,} rows imported")
-            
-            offset += chunk_size
-            chunk_num += 1
-            
-        except Exception as e:
-            print(f"Error processing chunk {chunk_num}: {e}")
-            # Log error and continue with next chunk
-            con.execute(f"""
-                INSERT INTO import_errors (error_message, row_content)
-                VALUES ('Chunk {chunk_num} processing error', '{str(e)[:500]}');
-            """)
-            offset += chunk_size
-            chunk_num += 1
-            
-            # Safety check to prevent infinite loop
-            if chunk_num > 10000:  # Adjust based on expected file size
-                print("Safety limit reached. Stopping chunk processing.")
-                break
+    try:
+        for block in reader:
+            for offset in range(0, block.num_rows, chunk_size):
+                batch = block.slice(offset, chunk_size)
+                print(f"Processing chunk {chunk_num}...")
+                
+                try:
+                    con.register('chunk_batch', batch)
+                    inserted = con.execute(insert_sql).fetchone()[0]
+                    
+                    total_rows += inserted
+                    print(f"  - Chunk {chunk_num} completed: {inserted:,} rows imported")
+                    
+                except Exception as e:
+                    print(f"Error processing chunk {chunk_num}: {e}")
+                    # Log error and continue with next chunk
+                    errors.append((f"Chunk {chunk_num} processing error", str(e)[:500]))
+                finally:
+                    con.unregister('chunk_batch')
+                
+                if len(errors) >= ERROR_FLUSH_SIZE:
+                    flush_import_errors(con, errors)
+                
+                chunk_num += 1
+    finally:
+        flush_import_errors(con, errors)
+    
+    if skipped_rows:
+        print(f"  - Skipped {skipped_rows:,} malformed rows (logged to import_errors)")
+    print(f"No more rows to process. Total rows imported: {total_rows:,}")
 
 
 if __name__ == '__main__':
@@ -409,5 +513,8 @@ if __name__ == '__main__':
         args.memory_limit,
         args.temp_dir,
         args.chunk_size,
-        args.skip_indexes
+        args.skip_indexes,
+        args.as_parquet,
+        args.max_temp_size,
+        args.threads
     )
\ No newline at end of file
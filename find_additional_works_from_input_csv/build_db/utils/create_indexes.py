@@ -24,20 +24,60 @@ def parse_arguments():
     parser.add_argument(
         "--temp-dir",
         default=None,
-        help="Temporary directory for disk spilling during index creation"
+        help="Temporary directory for disk spilling during index creation (default: DuckDB's own, <db-file>.tmp)"
+    )
+    parser.add_argument(
+        "--max-temp-size",
+        default=None,
+        help="Maximum disk space DuckDB may use for spilling (default: DuckDB's own, based on free disk space)"
     )
     parser.add_argument(
         "--indexes",
         nargs="+",
-        choices=["work_id", "doi", "norm_name", "norm_affil", "ror", "all"],
+        choices=["doi", "norm_affil", "all"],
         default=["all"],
         help="Which indexes to create (default: all)"
     )
+    parser.add_argument(
+        "--order-by",
+        choices=["work_id", "doi", "normalized_affiliation_key"],
+        default="work_id",
+        help="Column to sort the table by before indexing (default: work_id). "
+             "With 'doi' or 'normalized_affiliation_key', lookups on that column rely on "
+             "zonemap pruning and its index is not built"
+    )
 
     return parser.parse_args()
 
 
-def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"]):
+def cluster_table(con, column):
+    """Rewrite author_references physically sorted by column.
+
+    Sorted storage makes the following index builds close to sequential
+    inserts and tightens per-row-group min/max zonemaps for that column.
+    """
+    print(f"Clustering table 'author_references' by {column}...")
+    start_time = time.time()
+
+    con.execute("BEGIN TRANSACTION;")
+    try:
+        con.execute(f"""
+            CREATE TABLE author_references_sorted AS
+            SELECT * FROM author_references ORDER BY {column};
+        """)
+        con.execute("DROP TABLE author_references;")
+        con.execute("ALTER TABLE author_references_sorted RENAME TO author_references;")
+        con.execute("COMMIT;")
+    except Exception:
+        con.execute("ROLLBACK;")
+        raise
+
+    elapsed = time.time() - start_time
+    print(f"  Table clustered in {elapsed:.1f} seconds")
+
+
+def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"], max_temp_size=None,
+                   order_by="work_id"):
 
     if not os.path.exists(db_file):
         print(f"Error: Database file not found at '{db_file}'")
@@ -50,16 +90,18 @@ def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"
         print(f"Configuring database for index creation...")
         print(f"  Memory limit: {memory_limit}")
 
-        con.execute(f"SET memory_limit='{memory_limit}';")
+        con.execute("SET memory_limit=?;", [memory_limit])
         con.execute("SET preserve_insertion_order=false;")
 
-        con.execute("SET threads=4;")
-
+        # DuckDB's defaults (<db-file>.tmp, capped by free disk space) apply
+        # unless overridden
         if temp_dir:
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir)
+            os.makedirs(temp_dir, exist_ok=True)
             print(f"  Temp directory: {temp_dir}")
-            con.execute(f"SET temp_directory='{temp_dir}';")
+            con.execute("SET temp_directory=?;", [temp_dir])
+        if max_temp_size:
+            print(f"  Max temp directory size: {max_temp_size}")
+            con.execute("SET max_temp_directory_size=?;", [max_temp_size])
 
         table_check = con.execute("""
             SELECT COUNT(*) as row_count 
@@ -71,16 +113,42 @@ def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"
             print("Error: Table 'author_references' not found in database")
             sys.exit(1)
 
-        row_count = con.execute(
-            "SELECT COUNT(*) FROM author_references").fetchone()[0]
+        stats_check = con.execute("""
+            SELECT COUNT(*)
+            FROM information_schema.tables
+            WHERE table_name = 'db_stats'
+        """).fetchone()[0]
+
+        if stats_check > 0:
+            row_count = con.execute(
+                "SELECT total_rows FROM db_stats").fetchone()[0]
+        else:
+            row_count = con.execute(
+                "SELECT COUNT(*) FROM author_references").fetchone()[0]
         print(f"Table 'author_references' contains {row_count:,} rows")
 
+        index_count = con.execute("""
+            SELECT COUNT(*)
+            FROM duckdb_indexes()
+            WHERE table_name = 'author_references'
+        """).fetchone()[0]
+
+        if index_count == 0:
+            # Sort with all cores, then drop back for the ART builds
+            con.execute(f"SET threads={os.cpu_count()};")
+            cluster_table(con, order_by)
+        else:
+            print("Table already has indexes; skipping clustering (it would drop them)")
+
+        con.execute("SET threads=4;")
+
+        # work_id, normalized_author_name and affiliation_ror are left to
+        # DuckDB's vectorized scans + zonemaps (work_id benefits from the
+        # default clustering above); ART indexes on them rarely get picked by the
+        # optimizer and cost build time and disk.
         all_indexes = [
-            ("idx_work_id", "work_id", "work_id"),
             ("idx_doi", "doi", "doi"),
-            ("idx_norm_name", "normalized_author_name", "norm_name"),
-            ("idx_norm_affil", "normalized_affiliation_key", "norm_affil"),
-            ("idx_ror", "affiliation_ror", "ror")
+            ("idx_norm_affil", "normalized_affiliation_key", "norm_affil")
         ]
 
         if "all" in selected_indexes:
@@ -89,6 +157,13 @@ def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"
             indexes_to_create = [
                 idx for idx in all_indexes if idx[2] in selected_indexes]
 
+        sort_index = next((idx for idx in all_indexes if idx[1] == order_by), None)
+        if sort_index and index_count == 0:
+            # Sorted by the indexed column, equality lookups are pruned by zonemaps alone
+            print(f"Table ordered by {order_by}; skipping {sort_index[0]}")
+            indexes_to_create = [
+                idx for idx in indexes_to_create if idx[1] != order_by]
+
         print(f"\nCreating {len(indexes_to_create)} index(es)...")
         print("This may take considerable time for large datasets.\n")
 
@@ -98,11 +173,11 @@ def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"
         for idx_name, column, short_name in indexes_to_create:
             start_time = time.time()
 
-            existing = con.execute(f"""
+            existing = con.execute("""
                 SELECT COUNT(*) 
                 FROM duckdb_indexes() 
-                WHERE index_name = '{idx_name}'
-            """).fetchone()[0]
+                WHERE index_name = ?
+            """, [idx_name]).fetchone()[0]
 
             if existing > 0:
                 print(f"✓ Index {idx_name} already exists, skipping...")
@@ -112,10 +187,13 @@ def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"
             print(f"Creating index {idx_name} on column {column}...")
 
             try:
-                con.execute("CHECKPOINT;")
-                con.execute("PRAGMA force_checkpoint;")
-
-                con.execute(f"CREATE INDEX {idx_name} ON author_references ({column});")
+                con.execute("BEGIN TRANSACTION;")
+                try:
+                    con.execute(f"CREATE INDEX {idx_name} ON author_references ({column});")
+                    con.execute("COMMIT;")
+                except Exception:
+                    con.execute("ROLLBACK;")
+                    raise
 
                 elapsed = time.time() - start_time
                 print(f"  Index {idx_name} created in {elapsed:.1f} seconds")
@@ -125,11 +203,6 @@ def create_indexes(db_file, memory_limit, temp_dir=None, selected_indexes=["all"
                 print(f"  Failed to create index {idx_name}: {e}")
                 failed += 1
 
-                try:
-                    con.execute("PRAGMA force_checkpoint;")
-                except:
-                    pass
-
         print(f"\n{'='*50}")
         print(f"Index creation complete:")
         print(f"  Successful: {successful}")
@@ -158,7 +231,9 @@ def main():
         args.db_file,
         args.memory_limit,
         args.temp_dir,
-        args.indexes
+        args.indexes,
+        args.max_temp_size,
+        args.order_by
     )
 
 
@@ -48,8 +48,37 @@ def verify_database(db_file, sample_size=10):
             print("Table: author_references")
             print("-" * 50)
 
-            row_count = con.execute(
-                "SELECT COUNT(*) FROM author_references").fetchone()[0]
+            if any('db_stats' in t for t in tables):
+                # Counts materialized by build_db.py at build time
+                stats = con.execute("""
+                    SELECT
+                        total_rows,
+                        unique_works,
+                        unique_authors,
+                        unique_affiliations,
+                        unique_rors,
+                        rows_with_doi,
+                        rows_with_ror,
+                        rows_null_work_id,
+                        rows_null_author_name
+                    FROM db_stats
+                """).fetchone()
+            else:
+                stats = con.execute("""
+                    SELECT
+                        COUNT(*) as total_rows,
+                        COUNT(DISTINCT work_id) as unique_works,
+                        COUNT(DISTINCT author_name) as unique_authors,
+                        COUNT(DISTINCT affiliation_name) as unique_affiliations,
+                        COUNT(DISTINCT affiliation_ror) as unique_rors,
+                        COUNT(*) FILTER (WHERE doi IS NOT NULL) as rows_with_doi,
+                        COUNT(*) FILTER (WHERE affiliation_ror IS NOT NULL) as rows_with_ror,
+                        COUNT(*) FILTER (WHERE work_id IS NULL) as rows_null_work_id,
+                        COUNT(*) FILTER (WHERE author_name IS NULL) as rows_null_author_name
+                    FROM author_references
+                """).fetchone()
+
+            row_count = stats[0]
             print(f"Total rows: {row_count:,}")
 
             columns = con.execute("DESCRIBE author_references").fetchall()
@@ -71,51 +100,36 @@ def verify_database(db_file, sample_size=10):
                 print("  No indexes found")
 
             print("\nData Statistics:")
-            stats = con.execute("""
-                SELECT 
-                    COUNT(DISTINCT work_id) as unique_works,
-                    COUNT(DISTINCT author_name) as unique_authors,
-                    COUNT(DISTINCT affiliation_name) as unique_affiliations,
-                    COUNT(DISTINCT affiliation_ror) as unique_rors,
-                    COUNT(*) FILTER (WHERE doi IS NOT NULL) as rows_with_doi,
-                    COUNT(*) FILTER (WHERE affiliation_ror IS NOT NULL) as rows_with_ror
-                FROM author_references
-            """).fetchone()
-
-            print(f"  Unique works: {stats[0]:,}")
-            print(f"  Unique authors: {stats[1]:,}")
-            print(f"  Unique affiliations: {stats[2]:,}")
-            print(f"  Unique ROR IDs: {stats[3]:,}")
-            print(f"  Rows with DOI: {stats[4]:,} ({stats[4]*100/row_count:.1f}%)")
-            print(f"  Rows with ROR: {stats[5]:,} ({stats[5]*100/row_count:.1f}%)")
+            print(f"  Unique works: {stats[1]:,}")
+            print(f"  Unique authors: {stats[2]:,}")
+            print(f"  Unique affiliations: {stats[3]:,}")
+            print(f"  Unique ROR IDs: {stats[4]:,}")
+            print(f"  Rows with DOI: {stats[5]:,} ({stats[5]*100/row_count:.1f}%)")
+            print(f"  Rows with ROR: {stats[6]:,} ({stats[6]*100/row_count:.1f}%)")
 
             print("\nData Quality Checks:")
-
-            null_works = con.execute(
-                "SELECT COUNT(*) FROM author_references WHERE work_id IS NULL").fetchone()[0]
-            print(f"  Rows with NULL work_id: {null_works:,}")
-
-            null_authors = con.execute(
-                "SELECT COUNT(*) FROM author_references WHERE author_name IS NULL").fetchone()[0]
-            print(f"  Rows with NULL author_name: {null_authors:,}")
+            print(f"  Rows with NULL work_id: {stats[7]:,}")
+            print(f"  Rows with NULL author_name: {stats[8]:,}")
 
             print(f"\nSample Data (first {sample_size} rows):")
             print("-" * 50)
-            samples = con.execute(f"""
+            samples = con.execute("""
                 SELECT 
-                    work_id,
+                    CASE WHEN length(work_id) > 50
+                        THEN substr(work_id, 1, 50) || '...' ELSE work_id END,
                     author_name,
-                    affiliation_name,
+                    CASE WHEN length(affiliation_name) > 50
+                        THEN substr(affiliation_name, 1, 50) || '...' ELSE affiliation_name END,
                     affiliation_ror
                 FROM author_references 
-                LIMIT {sample_size}
-            """).fetchall()
+                LIMIT ?
+            """, [sample_size]).fetchall()
 
             for i, row in enumerate(samples, 1):
                 print(f"\nRow {i}:")
-                print(f"  Work ID: {row[0][:50]}..." if len(str(row[0])) > 50 else f"  Work ID: {row[0]}")
+                print(f"  Work ID: {row[0]}")
                 print(f"  Author: {row[1]}")
-                print(f"  Affiliation: {row[2][:50]}..." if row[2] and len(str(row[2])) > 50 else f"  Affiliation: {row[2]}")
+                print(f"  Affiliation: {row[2]}")
                 print(f"  ROR: {row[3]}")
 
         if any('import_errors' in t for t in tables):
@@ -1,8 +1,16 @@
-from .name_matching import parse_name_by_style, are_names_similar
-from .entity_extraction import EntityExtractor
+from .name_matching import (
+    ParsedName,
+    parse_name_by_style,
+    are_names_similar,
+    are_parsed_names_similar,
+)
+from .entity_extraction import EntityExtractor, CachedEntityExtractor
 
 __all__ = [
+    'ParsedName',
     'parse_name_by_style',
     'are_names_similar',
+    'are_parsed_names_similar',
     'EntityExtractor',
+    'CachedEntityExtractor',
 ]
\ No newline at end of file
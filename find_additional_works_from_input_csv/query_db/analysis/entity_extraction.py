@@ -1,70 +1,258 @@
-from flair.nn import Classifier
-from flair.data import Sentence
+import os
+import copy
+import json
+import hashlib
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from query_db.constants import DEFAULT_NER_BATCH_SIZE
+
+
+# Per-process extractor used by NER worker processes
+_worker_extractor = None
+
+
+def _init_ner_worker(batch_size, quantize):
+    global _worker_extractor
+    # One torch thread per worker so N workers don't oversubscribe the cores
+    _worker_extractor = EntityExtractor(batch_size, quantize, num_threads=1)
+
+
+def _worker_model_loaded():
+    return _worker_extractor.model is not None
+
+
+def _predict_shard(texts):
+    return _worker_extractor.predict_organizations(texts)
 
 
 class EntityExtractor:
     
-    def __init__(self):
+    def __init__(self, batch_size=DEFAULT_NER_BATCH_SIZE, quantize=False, workers=1, num_threads=None):
+        self.batch_size = batch_size
+        self.model = None
+        self.executor = None
+        
+        if workers > 1:
+            self._start_workers(workers, quantize)
+            return
+        
+        # flair pulls in torch and transformers; import only when NER is actually used
+        import torch
+        from flair.nn import Classifier
+        from flair.data import Sentence
+        self._torch = torch
+        self._Sentence = Sentence
+        
+        torch.set_num_threads(num_threads or os.cpu_count() or 1)
+        
         try:
             self.model = Classifier.load('flair/ner-english-fast')
             print("NER model loaded successfully.")
         except Exception as e:
             print(f"Warning: Could not load NER model: {e}")
             self.model = None
+        
+        if self.model and quantize:
+            self._quantize_model()
     
-    def extract_organizations(self, text):
-        if not text or not self.model:
-            return []
+    @property
+    def available(self):
+        return self.model is not None or self.executor is not None
+    
+    def _start_workers(self, workers, quantize):
+        """Load one model copy in each of `workers` processes; NER batches are sharded across them."""
+        print(f"Starting {workers} NER worker processes...")
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_ner_worker,
+            initargs=(self.batch_size, quantize)
+        )
+        self.workers = workers
+        
+        try:
+            loaded = self.executor.submit(_worker_model_loaded).result()
+        except Exception as e:
+            print(f"Warning: Could not start NER workers: {e}")
+            loaded = False
+        
+        if not loaded:
+            self.executor.shutdown()
+            self.executor = None
+    
+    def _quantize_model(self):
+        torch = self._torch
         
+        # The converted model replaces the original only once it has predicted
+        # successfully, so a failed conversion leaves full precision in place
         try:
-            sentence = Sentence(text)
-            self.model.predict(sentence)
+            if torch.cuda.is_available():
+                # Module.half() converts in place, so work on a copy
+                converted = copy.deepcopy(self.model).half()
+                precision = "FP16"
+            else:
+                converted = torch.quantization.quantize_dynamic(
+                    self.model, {torch.nn.LSTM, torch.nn.Linear}, dtype=torch.qint8)
+                precision = "int8"
+            # Warm up so kernel selection happens before the real batches
+            converted.predict(self._Sentence("University of Wageningen"), verbose=False)
+        except Exception as e:
+            print(f"Warning: Could not quantize NER model, using full precision: {e}")
+            return
+        
+        self.model = converted
+        print(f"NER model converted to {precision}.")
+    
+    def predict_organizations(self, texts):
+        """Return the ORG spans found in each text, in input order.
+        
+        Entries are None where prediction failed for that text's batch.
+        """
+        if self.executor:
+            return self._predict_in_workers(texts)
+        
+        results = [None] * len(texts)
+        
+        # Sort by token count so each mini-batch pads to a similar length
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i].split()))
+        
+        for start in range(0, len(order), self.batch_size):
+            batch_indices = order[start:start + self.batch_size]
+            sentences = [self._Sentence(texts[i]) for i in batch_indices]
             
-            organizations = []
-            for entity in sentence.get_spans('ner'):
-                if entity.tag == 'ORG':
-                    organizations.append(entity.text)
+            try:
+                # inference_mode skips autograd bookkeeping entirely
+                with self._torch.inference_mode():
+                    self.model.predict(sentences, mini_batch_size=self.batch_size,
+                                       embedding_storage_mode='none', verbose=False)
+            except Exception as e:
+                print(f"Warning: Error during batch NER prediction: {e}")
+                continue
             
-            return organizations
-        except Exception as e:
-            print(f"Warning: Error extracting organizations from text: {e}")
+            for i, sentence in zip(batch_indices, sentences):
+                results[i] = [entity.text for entity in sentence.get_spans('ner') if entity.tag == 'ORG']
+        
+        return results
+    
+    def _predict_in_workers(self, texts):
+        # Interleaved shards give each worker a similar mix of short and long texts
+        shards = [list(range(w, len(texts), self.workers)) for w in range(self.workers)]
+        shards = [shard for shard in shards if shard]
+        
+        # Like a failed in-process batch, a failed shard (including a crashed
+        # worker, after which the pool refuses new work) leaves its entries as None
+        results = [None] * len(texts)
+        pending = []
+        for shard in shards:
+            try:
+                pending.append((shard, self.executor.submit(_predict_shard, [texts[i] for i in shard])))
+            except Exception as e:
+                print(f"Warning: Could not submit NER batch to workers: {e}")
+        
+        for shard, future in pending:
+            try:
+                shard_results = future.result()
+            except Exception as e:
+                print(f"Warning: Error during NER prediction in worker: {e}")
+                continue
+            for i, organizations in zip(shard, shard_results):
+                results[i] = organizations
+        
+        return results
+    
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
+    
+    def extract_organizations(self, text):
+        if not text or not self.available:
             return []
+        
+        return self.predict_organizations([text])[0] or []
     
     def extract_and_validate_from_affiliations(self, unique_affiliations, original_affiliations_map):
-        if not self.model:
+        if not self.available:
             return []
         
         extracted_entities = []
         
-        valid_affiliations = []
-        affiliation_to_keys = {}
-        
-        for norm_affil, orig_affil in original_affiliations_map.items():
-            if not orig_affil:
-                continue
-            
-            if orig_affil not in affiliation_to_keys:
-                affiliation_to_keys[orig_affil] = []
-                valid_affiliations.append(orig_affil)
-            
-            affiliation_to_keys[orig_affil].append(norm_affil)
+        # Distinct non-blank originals in first-seen order
+        valid_affiliations = dict.fromkeys(
+            orig_affil for orig_affil in original_affiliations_map.values()
+            if orig_affil and orig_affil.strip()
+        )
         
         if not valid_affiliations:
             return extracted_entities
         
-        sentences = [Sentence(affil) for affil in valid_affiliations]
+        # Spellings that differ only in whitespace tokenize identically, so
+        # run NER once per collapsed form and fan results back out. Case is
+        # kept because the NER model is case-sensitive.
+        canon_to_origs = {}
+        for orig_affil in valid_affiliations:
+            canon_to_origs.setdefault(' '.join(orig_affil.split()), []).append(orig_affil)
         
-        try:
-            self.model.predict(sentences)
-        except Exception as e:
-            print(f"Warning: Error during batch NER prediction: {e}")
-            return extracted_entities
+        canonical_affiliations = list(canon_to_origs)
+        entities_by_affiliation = self.predict_organizations(canonical_affiliations)
+        
+        for canon, entities in zip(canonical_affiliations, entities_by_affiliation):
+            for orig_affil in canon_to_origs[canon]:
+                for entity_text in entities or []:
+                    extracted_entities.append((entity_text, orig_affil))
+        
+        return extracted_entities
+
+
+class CachedEntityExtractor(EntityExtractor):
+    """EntityExtractor that persists NER results in a SQLite file.
+    
+    The same affiliation strings recur across input files and runs, so only
+    texts not seen before are passed to the model.
+    """
+    
+    def __init__(self, cache_path, batch_size=DEFAULT_NER_BATCH_SIZE, quantize=False, workers=1):
+        super().__init__(batch_size, quantize, workers)
+        self.cache = sqlite3.connect(cache_path)
+        self.cache.execute(
+            "CREATE TABLE IF NOT EXISTS ner_cache (key TEXT PRIMARY KEY, organizations TEXT)")
+        self.cache.commit()
+        print(f"Using NER cache at '{cache_path}'.")
+    
+    @staticmethod
+    def _cache_key(text):
+        return hashlib.sha1(text.encode('utf-8')).hexdigest()
+    
+    def predict_organizations(self, texts):
+        keys = [self._cache_key(text) for text in texts]
         
-        for i, sentence in enumerate(sentences):
-            orig_affil = valid_affiliations[i]
+        cached = {}
+        for start in range(0, len(keys), 500):
+            key_batch = keys[start:start + 500]
+            placeholders = ','.join('?' * len(key_batch))
+            cached.update(self.cache.execute(
+                f"SELECT key, organizations FROM ner_cache WHERE key IN ({placeholders})", key_batch))
+        
+        results = [json.loads(cached[key]) if key in cached else None for key in keys]
+        misses = [i for i, result in enumerate(results) if result is None]
+        print(f"  NER cache: {len(texts) - len(misses)} hits, {len(misses)} misses")
+        
+        if misses:
+            predicted = super().predict_organizations([texts[i] for i in misses])
+            new_entries = []
+            for i, organizations in zip(misses, predicted):
+                results[i] = organizations
+                if organizations is not None:
+                    new_entries.append((keys[i], json.dumps(organizations)))
             
-            for entity in sentence.get_spans('ner'):
-                if entity.tag == 'ORG':
-                    extracted_entities.append((entity.text, orig_affil))
+            self.cache.executemany(
+                "INSERT OR REPLACE INTO ner_cache (key, organizations) VALUES (?, ?)", new_entries)
+            self.cache.commit()
         
-        return extracted_entities
\ No newline at end of file
+        return results
+    
+    def close(self):
+        self.cache.close()
+        super().close()
\ No newline at end of file
@@ -1,82 +1,191 @@
-import re
 import unicodedata
-import jellyfish
+from functools import lru_cache
+from typing import NamedTuple
 from nameparser import HumanName
+from nameparser.config import CONSTANTS
+from rapidfuzz.distance import JaroWinkler
 
+# Name separators replaced by spaces in the normalized form
+_PUNCT_TABLE = str.maketrans({'-': ' ', '.': ' ', ',': ' '})
 
-def parse_name_by_style(name, style):
-    name = name.strip()
+# Words HumanName gives special meaning (titles, suffixes, surname
+# prefixes, conjunctions, and in nameparser 2 bound first names and
+# birth-name markers); names containing them are always handed to it
+try:
+    from nameparser.config.maiden_markers import MAIDEN_MARKERS as _MAIDEN_MARKERS
+except ImportError:
+    _MAIDEN_MARKERS = ()
+
+_HUMANNAME_SPECIAL_WORDS = frozenset(
+    word.lower()
+    for word_set in (CONSTANTS.titles, CONSTANTS.suffix_acronyms, CONSTANTS.suffix_not_acronyms,
+                     CONSTANTS.prefixes, CONSTANTS.conjunctions,
+                     getattr(CONSTANTS, 'bound_first_names', ()),
+                     getattr(CONSTANTS, 'non_first_name_prefixes', ()),
+                     _MAIDEN_MARKERS)
+    for word in word_set
+)
+_ROMAN_NUMERAL_RE = CONSTANTS.regexes.roman_numeral
+
+
+class ParsedName(NamedTuple):
+    first: str
+    last: str
+    middle: str
+    normalized: str
+    original: str
+    style: str
+
+
+def _parse_last_initial(name, style):
+    parts = name.split()
+    if len(parts) >= 2:
+        last_name = ' '.join(parts[:-1])
+        initials = parts[-1]
+        first_initial = initials[0].lower() if initials else ''
+        return ParsedName(first_initial, last_name.lower(), '', f"{last_name.lower()} {first_initial}", name, style)
+    else:
+        return ParsedName('', name.lower(), '', name.lower(), name, style)
+
+
+def _parse_last_comma_first(name, style):
+    if ',' in name:
+        parts = name.split(',', 1)
+        last = parts[0].strip()
+        rest = parts[1].strip() if len(parts) > 1 else ''
+        rest_parts = rest.split()
+        first = rest_parts[0].lower() if rest_parts else ''
+        middle = ' '.join(rest_parts[1:]).lower() if len(rest_parts) > 1 else ''
+        return ParsedName(first, last.lower(), middle, f"{first} {middle} {last.lower()}".strip(), name, style)
 
-    if style == 'last_initial':
-        parts = name.split()
-        if len(parts) >= 2:
-            last_name = ' '.join(parts[:-1])
-            initials = parts[-1]
-            first_initial = initials[0].lower() if initials else ''
-            return {'first': first_initial, 'last': last_name.lower(), 'middle': '', 'normalized': f"{last_name.lower()} {first_initial}", 'original': name, 'style': style}
+
+def _parse_last_first(name, style):
+    parts = name.split()
+    if len(parts) >= 2:
+        last = parts[0]
+        first = parts[1] if len(parts) > 1 else ''
+        middle = ' '.join(parts[2:]) if len(parts) > 2 else ''
+        return ParsedName(first.lower(), last.lower(), middle.lower(), f"{first.lower()} {middle.lower()} {last.lower()}".strip(), name, style)
+
+
+def _parse_first_initial_last(name, style):
+    parts = name.split()
+    initials = []
+    last_idx = -1
+    for i, part in enumerate(parts):
+        if len(part) <= 2 and (part.endswith('.') or len(part) == 1):
+            initials.append(part.replace('.', '').lower())
         else:
-            return {'first': '', 'last': name.lower(), 'middle': '', 'normalized': name.lower(), 'original': name, 'style': style}
-
-    elif style == 'last_comma_first':
-        if ',' in name:
-            parts = name.split(',', 1)
-            last = parts[0].strip()
-            rest = parts[1].strip() if len(parts) > 1 else ''
-            rest_parts = rest.split()
-            first = rest_parts[0].lower() if rest_parts else ''
-            middle = ' '.join(rest_parts[1:]).lower() if len(rest_parts) > 1 else ''
-            return {'first': first, 'last': last.lower(), 'middle': middle, 'normalized': f"{first} {middle} {last.lower()}".strip(), 'original': name, 'style': style}
-
-    elif style == 'last_first':
-        parts = name.split()
-        if len(parts) >= 2:
-            last = parts[0]
-            first = parts[1] if len(parts) > 1 else ''
-            middle = ' '.join(parts[2:]) if len(parts) > 2 else ''
-            return {'first': first.lower(), 'last': last.lower(), 'middle': middle.lower(), 'normalized': f"{first.lower()} {middle.lower()} {last.lower()}".strip(), 'original': name, 'style': style}
-
-    elif style == 'first_initial_last':
-        parts = name.split()
-        initials = []
-        last_idx = -1
-        for i, part in enumerate(parts):
-            if len(part) <= 2 and (part.endswith('.') or len(part) == 1):
-                initials.append(part.replace('.', '').lower())
-            else:
-                last_idx = i
-                break
-        if last_idx >= 0:
-            last = ' '.join(parts[last_idx:])
-            first = initials[0] if initials else ''
-            middle = ' '.join(initials[1:]) if len(initials) > 1 else ''
-            return {'first': first, 'last': last.lower(), 'middle': middle, 'normalized': f"{first} {middle} {last.lower()}".strip(), 'original': name, 'style': style}
-    
-    parsed = HumanName(name)
-    first = (parsed.first or '').strip()
-    last = (parsed.last or '').strip()
-    middle = (parsed.middle or '').strip()
+            last_idx = i
+            break
+    if last_idx >= 0:
+        last = ' '.join(parts[last_idx:])
+        first = initials[0] if initials else ''
+        middle = ' '.join(initials[1:]) if len(initials) > 1 else ''
+        return ParsedName(first, last.lower(), middle, f"{first} {middle} {last.lower()}".strip(), name, style)
+
+
+def _parse_first_last(name):
+    parts = name.split()
+    if _is_plain_first_last(name, parts):
+        # HumanName would split these words positionally; skip its lookups
+        first, middle, last = parts[0], ' '.join(parts[1:-1]), parts[-1]
+    else:
+        parsed = HumanName(name)
+        first = (parsed.first or '').strip()
+        last = (parsed.last or '').strip()
+        middle = (parsed.middle or '').strip()
     clean = f"{first} {middle} {last}".strip()
-    clean = unicodedata.normalize('NFKD', clean).encode('ascii', 'ignore').decode()
-    normalized = re.sub(r'[-.,]', ' ', clean.lower()).strip()
-    return {'first': first.lower(), 'last': last.lower(), 'middle': middle.lower(), 'normalized': normalized, 'original': name, 'style': 'first_last'}
+    if not clean.isascii():
+        clean = unicodedata.normalize('NFKD', clean).encode('ascii', 'ignore').decode()
+    normalized = clean.lower().translate(_PUNCT_TABLE).strip()
+    return ParsedName(first.lower(), last.lower(), middle.lower(), normalized, name, 'first_last')
+
+
+# Style-specific parsers return None when the name doesn't fit the style;
+# those names and any other style ('auto', 'first_last') go to HumanName
+_STYLE_PARSERS = {
+    'last_initial': _parse_last_initial,
+    'last_comma_first': _parse_last_comma_first,
+    'last_first': _parse_last_first,
+    'first_initial_last': _parse_first_initial_last,
+}
+
+
+# Author names recur across works, so parses are memoized
+@lru_cache(maxsize=262144)
+def parse_name_by_style(name, style):
+    name = name.strip()
+
+    style_parser = _STYLE_PARSERS.get(style)
+    if style_parser:
+        parsed = style_parser(name, style)
+        if parsed:
+            return parsed
+
+    return _parse_first_last(name)
+
+
+def _is_plain_word(part):
+    return len(part) >= 2 and part.isalpha()
+
+
+def _is_initial(part):
+    return len(part) == 2 and part[0].isalpha() and part[1] == '.'
+
+
+def _is_plain_first_last(name, parts):
+    # Two or three Latin-script words, those before the last optionally
+    # "X." initials, with no other punctuation or digits (nicknames and
+    # comma forms need some) and no word HumanName has a rule for
+    return (
+        2 <= len(parts) <= 3
+        and _is_plain_word(parts[-1])
+        and all(_is_plain_word(part) or _is_initial(part) for part in parts[:-1])
+        and max(name) <= '\u024F'
+        and not any(part.lower().rstrip('.') in _HUMANNAME_SPECIAL_WORDS for part in parts)
+        and not any(_ROMAN_NUMERAL_RE.match(part) for part in parts)
+    )
+
+
+def jaro_winkler_upper_bound(len1, len2):
+    """Highest Jaro-Winkler score two non-empty strings of these lengths can reach.
+
+    Jaro is at most (2 + shorter/longer) / 3 and the Winkler prefix bonus
+    lifts a score to at most jaro + 0.4 * (1 - jaro) = 0.4 + 0.6 * jaro,
+    so pairs below this bound can be rejected without comparing characters.
+    """
+    ratio = min(len1, len2) / max(len1, len2)
+    return 0.4 + 0.6 * (2 + ratio) / 3
 
 
 def are_names_similar(name1_str, name2_str, name1_style='auto', name2_style='auto', threshold=0.85):
-    name1 = parse_name_by_style(name1_str, name1_style)
-    name2 = parse_name_by_style(name2_str, name2_style)
-    if not name1['last'] or not name2['last']:
-        return name1['normalized'] == name2['normalized']
-    last_similarity = jellyfish.jaro_winkler_similarity(name1['last'], name2['last'])
+    """Accepts raw strings or ParsedName values (for which the styles are ignored)."""
+    name1 = name1_str if isinstance(name1_str, ParsedName) else parse_name_by_style(name1_str, name1_style)
+    name2 = name2_str if isinstance(name2_str, ParsedName) else parse_name_by_style(name2_str, name2_style)
+    return are_parsed_names_similar(name1, name2, threshold)
+
+
+def are_parsed_names_similar(name1, name2, threshold=0.85):
+    if not name1.last or not name2.last:
+        return name1.normalized == name2.normalized
+    # The same author on both sides scores 1.0 on every comparison below
+    if name1.last == name2.last and name1.first == name2.first:
+        return True
+    if jaro_winkler_upper_bound(len(name1.last), len(name2.last)) < threshold:
+        return False
+    last_similarity = JaroWinkler.normalized_similarity(name1.last, name2.last)
     if last_similarity < threshold:
         return False
-    if name1['first'] and name2['first']:
-        if len(name1['first']) == 1 or len(name2['first']) == 1:
-            if name1['first'][0] == name2['first'][0]:
+    if name1.first and name2.first:
+        if len(name1.first) == 1 or len(name2.first) == 1:
+            if name1.first[0] == name2.first[0]:
                 return True
         else:
-            first_similarity = jellyfish.jaro_winkler_similarity(name1['first'], name2['first'])
+            first_similarity = JaroWinkler.normalized_similarity(name1.first, name2.first)
             if first_similarity >= threshold:
                 return True
     if last_similarity >= 0.95:
         return True
-    return False
\ No newline at end of file
+    return False
+
@@ -1,11 +1,16 @@
 import sys
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 def load_config(config_path):
     try:
         with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
     except Exception as e:
         print(f"Error loading configuration file: {e}")
         sys.exit(1)
\ No newline at end of file
@@ -20,6 +20,14 @@ DEFAULT_CHUNK_SIZE = 100000
 DEFAULT_MEMORY_LIMIT = "8GB"
 DEFAULT_NAME_THRESHOLD = 0.85
 DEFAULT_ENTITY_THRESHOLD = 85
+DEFAULT_NER_BATCH_SIZE = 64
+DEFAULT_OUTPUT_FORMAT = "csv"
+
+# COPY options for each supported output format
+OUTPUT_FORMAT_OPTIONS = {
+    "csv": "(HEADER, DELIMITER ',')",
+    "parquet": "(FORMAT PARQUET, COMPRESSION 'zstd')",
+}
 
 # Database table names
 TABLE_AUTHOR_REFERENCES = "author_references"
@@ -29,6 +37,7 @@ TEMP_TABLE_ENTITY_KEYS = "entity_keys"
 TEMP_TABLE_ENTITY_DISCOVERED = "entity_discovered_works"
 TEMP_TABLE_AFFILIATION_DISCOVERED = "affiliation_discovered_works"
 TEMP_TABLE_ALREADY_DISCOVERED = "already_discovered_works"
+TEMP_TABLE_COMBINED_DISCOVERED = "combined_discovered_works"
 TEMP_TABLE_KNOWN_ORGS = "temp_known_orgs"
 TEMP_TABLE_LINKAGE_RESULTS = "temp_linkage_results"
 
@@ -1,22 +1,46 @@
+import os
 import duckdb
 import pandas as pd
 from query_db.utils import validate_memory_limit
 
 
 class DatabaseManager:
-    def __init__(self, db_file, memory_limit="8GB", read_only=False):
+    def __init__(self, db_file, memory_limit="8GB", read_only=False, threads=None, temp_dir=None):
         validated_memory_limit = validate_memory_limit(memory_limit)
+        threads = int(threads or os.cpu_count() or 1)
         
         self.db_file = db_file
         self.con = duckdb.connect(database=db_file, read_only=read_only)
-        self.con.execute(f"SET memory_limit='{validated_memory_limit}';")
-        self.con.execute("PRAGMA threads=1;")
+        self.con.execute("SET memory_limit=?;", [validated_memory_limit])
+        self.con.execute(f"PRAGMA threads={threads};")
+        if temp_dir:
+            os.makedirs(temp_dir, exist_ok=True)
+            self.con.execute("SET temp_directory=?;", [temp_dir])
+        self.con.execute("PRAGMA enable_object_cache=true;")
+        self.con.execute("PRAGMA enable_progress_bar=false;")
+        # Result order is never relied on without an ORDER BY
+        self.con.execute("SET preserve_insertion_order=false;")
     
+    # Statements are not cached: every query here is a set-based pass run a
+    # few times per chunk, so parse+plan is negligible next to execution, and
+    # the Python client has no reusable prepared-statement handle.
     def query_df(self, sql_query, params=None):
         if params:
             return self.con.execute(sql_query, params).fetch_df()
         return self.con.execute(sql_query).fetch_df()
     
+    def query_arrow(self, sql_query, params=None):
+        if params:
+            return self.con.execute(sql_query, params).arrow()
+        return self.con.execute(sql_query).arrow()
+    
+    def query_batches(self, sql_query, params=None, batch_size=65536):
+        # Returns a pyarrow RecordBatchReader; it is invalidated by the next
+        # query on this connection, so consume it before running another
+        if params:
+            return self.con.execute(sql_query, params).fetch_record_batch(batch_size)
+        return self.con.execute(sql_query).fetch_record_batch(batch_size)
+    
     def query(self, sql_query, params=None):
         if params:
             return self.con.execute(sql_query, params).fetchall()
@@ -36,8 +60,11 @@ class DatabaseManager:
     def register_df(self, name, df):
         self.con.register(name, df)
     
-    def create_function(self, name, func, arg_types, return_type):
-        self.con.create_function(name, func, arg_types, return_type)
+    def register_arrow(self, name, table):
+        self.con.register(name, table)
+    
+    def create_function(self, name, func, arg_types, return_type, udf_type='native'):
+        self.con.create_function(name, func, arg_types, return_type, type=udf_type)
     
     def close(self):
         if self.con:
@@ -5,8 +5,8 @@ import argparse
 from query_db.config import load_config
 from query_db.db import DatabaseManager
 from query_db.workflows import FileProcessor, AffiliationSearchProcessor
-from query_db.analysis.entity_extraction import EntityExtractor
-from query_db.constants import DEFAULT_MEMORY_LIMIT
+from query_db.analysis.entity_extraction import EntityExtractor, CachedEntityExtractor
+from query_db.constants import DEFAULT_MEMORY_LIMIT, DEFAULT_OUTPUT_FORMAT, OUTPUT_FORMAT_OPTIONS
 from query_db.udf import register_all_udfs
 
 
@@ -36,6 +36,13 @@ def parse_arguments():
                         help="Path to the DuckDB database file to use.")
     parser.add_argument("-m", "--memory-limit", default=DEFAULT_MEMORY_LIMIT,
                         help=f"Memory limit for DB processing (e.g., '16GB', '2GB'). Default: {DEFAULT_MEMORY_LIMIT}")
+    parser.add_argument("--db-threads", type=int, default=None,
+                        help="Number of DuckDB worker threads. Default: all cores (use 1 for debugging).")
+    parser.add_argument("--temp-dir", default=None,
+                        help="Directory DuckDB spills to when the memory limit is reached (e.g., on a fast SSD). Default: <db-file>.tmp")
+    parser.add_argument("--output-format", choices=list(OUTPUT_FORMAT_OPTIONS), default=DEFAULT_OUTPUT_FORMAT,
+                        help="Format of the result files. Parquet skips CSV text formatting and is smaller "
+                             "for downstream tools that read it. Default: csv")
     parser.add_argument("-c", "--config", required=True,
                         help="Path to the YAML configuration file.")
 
@@ -67,7 +74,9 @@ def main():
     db_manager = DatabaseManager(
         db_file=args.db_file,
         memory_limit=args.memory_limit,
-        read_only=(args.search_affiliation)
+        read_only=(args.search_affiliation),
+        threads=args.db_threads,
+        temp_dir=args.temp_dir
     )
     
     if use_udf and not args.process_file:
@@ -79,22 +88,31 @@ def main():
             print(f"Warning: UDF registration failed, continuing without UDFs: {e}")
             use_udf = False
     
+    entity_extractor = None
     try:
         if args.process_file:
-            entity_extractor = None
             if config.get('entity_extraction_enabled', True):
                 print("Initializing NER model for entity extraction...")
-                entity_extractor = EntityExtractor()
+                ner_cache_path = config.get('ner_cache_path')
+                ner_quantize = config.get('ner_quantize', False)
+                ner_workers = config.get('ner_workers', 1)
+                if ner_cache_path:
+                    entity_extractor = CachedEntityExtractor(
+                        ner_cache_path, quantize=ner_quantize, workers=ner_workers)
+                else:
+                    entity_extractor = EntityExtractor(quantize=ner_quantize, workers=ner_workers)
             
-            processor = FileProcessor(db_manager, config, entity_extractor)
+            processor = FileProcessor(db_manager, config, entity_extractor, output_format=args.output_format)
             processor.run(args.input_file, args.output_file)
             
         elif args.search_affiliation:
-            processor = AffiliationSearchProcessor(db_manager, config)
+            processor = AffiliationSearchProcessor(db_manager, config, output_format=args.output_format)
             processor.run(args.input_file, args.output_file)
             
     
     finally:
+        if entity_extractor:
+            entity_extractor.close()
         db_manager.close()
 
 
@@ -1,6 +1,8 @@
 """Repository class for all database operations related to author references."""
 
+import re
 import pandas as pd
+import pyarrow as pa
 from query_db.db import DatabaseManager
 from query_db.constants import *
 from query_db.utils import extract_doi, normalize_text, sanitize_file_path_for_sql, validate_column_name
@@ -40,9 +42,9 @@ class AuthorReferencesRepository:
             query = f"""
             CREATE OR REPLACE TEMP TABLE {TEMP_TABLE_INPUT_IDS} AS
             SELECT DISTINCT {select_clause}
-            FROM read_csv_auto('{safe_input_file}', HEADER=TRUE, ALL_VARCHAR=TRUE);
+            FROM read_csv_auto(?, HEADER=TRUE, ALL_VARCHAR=TRUE);
             """
-            self.db.execute(query)
+            self.db.execute(query, [safe_input_file])
             
             self.db.execute(f"CREATE OR REPLACE TEMP VIEW {TEMP_VIEW_UNIQUE_IDS} AS SELECT * FROM {TEMP_TABLE_INPUT_IDS};")
             
@@ -54,12 +56,20 @@ class AuthorReferencesRepository:
     def query_authors_for_linkage_udf(self, chunk_df: pd.DataFrame, input_doi_col: str = None, 
                                      input_work_id_col: str = None, authors_col: str = None, 
                                      author_sep: str = '', input_name_style: str = 'first_last',
-                                     reference_name_style: str = 'first_last', name_threshold: float = 0.85):
+                                     reference_name_style: str = 'first_last', name_threshold: float = 0.85,
+                                     filter_names: bool = True):
         if not authors_col:
             raise ValueError("authors_col must be specified")
         
         try:
-            processed_chunk_df = chunk_df.copy()
+            # Only the id and author columns are read below; selecting them
+            # copies far less than the full chunk, and DOI cleaning runs once
+            # per distinct input row
+            input_cols = [
+                col for col in dict.fromkeys((input_doi_col, input_work_id_col, authors_col))
+                if col and col in chunk_df.columns
+            ]
+            processed_chunk_df = chunk_df[input_cols].drop_duplicates()
             
             if input_doi_col and input_doi_col in processed_chunk_df.columns:
                 processed_chunk_df['clean_doi'] = processed_chunk_df[input_doi_col].apply(
@@ -72,12 +82,14 @@ class AuthorReferencesRepository:
             self.db.register_df(temp_input_table, processed_chunk_df)
             
             id_selection = []
-            id_selection.append('clean_doi AS input_doi')
+            # Typed explicitly: an all-NULL id column would otherwise not be
+            # VARCHAR and fail the != '' filters in the joins below
+            id_selection.append('clean_doi::VARCHAR AS input_doi')
             
             if input_work_id_col: 
                 id_selection.append(f'"{input_work_id_col}" AS input_work_id')
             else: 
-                id_selection.append('NULL AS input_work_id')
+                id_selection.append('NULL::VARCHAR AS input_work_id')
             
             additional_valid_cols = {authors_col}
             if input_doi_col:
@@ -86,11 +98,11 @@ class AuthorReferencesRepository:
                 additional_valid_cols.add(input_work_id_col)
             validated_authors_col = validate_column_name(authors_col, additional_valid_cols)
             escaped_authors_col = validated_authors_col.replace('"', '""')
-            escaped_input_style = input_name_style.replace("'", "''")
-            escaped_ref_style = reference_name_style.replace("'", "''")
             
             author_filter = f'WHERE "{escaped_authors_col}" IS NOT NULL AND trim("{escaped_authors_col}") != \'\''
             
+            # The separator is bound rather than quoted into the SQL text
+            query_params = []
             if author_sep == '':
                 input_authors_subquery = f"""
                     SELECT DISTINCT 
@@ -100,48 +112,72 @@ class AuthorReferencesRepository:
                     {author_filter}
                 """
             else:
-                escaped_separator = author_sep.replace('$', '$$')
+                query_params.append(author_sep)
                 input_authors_subquery = f"""
                     SELECT DISTINCT 
                         {', '.join(id_selection)},
-                        trim(UNNEST(string_split(trim("{escaped_authors_col}"), $${escaped_separator}$$))) AS input_author
+                        trim(UNNEST(string_split(trim("{escaped_authors_col}"), ?))) AS input_author
                     FROM {temp_input_table} 
                     {author_filter}
                 """
             
+            # The DOI and work_id matches are separate equi-joins: an OR in
+            # the join condition can only run as a nested-loop join against
+            # the whole reference table. UNION dedupes the candidate pairs
+            # before the name UDF sees them.
             udf_linkage_query = f"""
-                SELECT DISTINCT
-                    inp.input_doi,
-                    inp.input_work_id, 
-                    inp.input_author,
-                    ref.author_name AS ref_author_name,
-                    ref.normalized_affiliation_name AS ref_affiliation
-                FROM ({input_authors_subquery}) AS inp
-                JOIN {TABLE_AUTHOR_REFERENCES} AS ref ON (
+                WITH inp AS ({input_authors_subquery}),
+                candidates AS (
                     -- Match by DOI if both are available and not empty
-                    (inp.input_doi IS NOT NULL AND inp.input_doi != '' 
-                     AND ref.doi IS NOT NULL AND ref.doi != ''
-                     AND inp.input_doi = ref.doi)
-                    OR
-                    -- Match by work_id if both are available and not empty  
-                    (inp.input_work_id IS NOT NULL AND inp.input_work_id != ''
-                     AND ref.work_id IS NOT NULL AND ref.work_id != ''
-                     AND inp.input_work_id = ref.work_id)
-                ) 
+                    SELECT
+                        inp.input_doi,
+                        inp.input_work_id,
+                        inp.input_author,
+                        ref.author_name AS ref_author_name,
+                        ref.normalized_affiliation_name AS ref_affiliation,
+                        ref.normalized_affiliation_key AS ref_affiliation_key
+                    FROM inp
+                    JOIN {TABLE_AUTHOR_REFERENCES} AS ref ON inp.input_doi = ref.doi
+                    WHERE inp.input_doi != ''
+                    UNION
+                    -- Match by work_id if both are available and not empty
+                    SELECT
+                        inp.input_doi,
+                        inp.input_work_id,
+                        inp.input_author,
+                        ref.author_name AS ref_author_name,
+                        ref.normalized_affiliation_name AS ref_affiliation,
+                        ref.normalized_affiliation_key AS ref_affiliation_key
+                    FROM inp
+                    JOIN {TABLE_AUTHOR_REFERENCES} AS ref ON inp.input_work_id = ref.work_id
+                    WHERE inp.input_work_id != ''
+                )
+                SELECT *
+                FROM candidates
+                WHERE input_author IS NOT NULL 
+                AND input_author != ''
+                AND ref_author_name IS NOT NULL 
+                AND ref_author_name != ''
+            """
+            
+            # With filter_names=False the caller gets every candidate pair and
+            # applies the name test itself (e.g. across worker processes)
+            if not filter_names:
+                return self.db.query_batches(udf_linkage_query, query_params)
+            
+            udf_linkage_query += """
                 AND are_names_similar_udf(
-                    inp.input_author, 
-                    ref.author_name, 
-                    '{escaped_input_style}', 
-                    '{escaped_ref_style}', 
-                    {name_threshold}
+                    input_author, 
+                    ref_author_name, 
+                    ?, 
+                    ?, 
+                    ?
                 )
-                WHERE inp.input_author IS NOT NULL 
-                AND inp.input_author != ''
-                AND ref.author_name IS NOT NULL 
-                AND ref.author_name != ''
             """
             
-            return self.db.query(udf_linkage_query)
+            # Streamed in Arrow batches; the caller consumes it before the next query
+            return self.db.query_batches(
+                udf_linkage_query, query_params + [input_name_style, reference_name_style, name_threshold])
             
         except Exception as e:
             raise RuntimeError(f"Failed to query authors for linkage using UDF: {e}")
@@ -155,23 +191,24 @@ class AuthorReferencesRepository:
                 input_author_name VARCHAR,
                 ref_author_name VARCHAR,
                 ref_affiliation VARCHAR,
-                linkage_status VARCHAR
+                linkage_status VARCHAR,
+                ref_affiliation_key VARCHAR
             )
         """)
     
-    def insert_linkage_results(self, linkage_data: list):
+    def insert_linkage_results(self, linkage_table: pa.Table):
         """Bulk inserts linkage results into the temporary table."""
-        if not linkage_data:
+        if not linkage_table:
             return
-        linkage_df = pd.DataFrame(linkage_data)
-        self.db.register_df('linkage_chunk_df', linkage_df)
-        self.db.execute(f"INSERT INTO {TEMP_TABLE_LINKAGE_RESULTS} SELECT * FROM linkage_chunk_df")
+        self.db.register_arrow('linkage_chunk_table', linkage_table)
+        self.db.execute(f"INSERT INTO {TEMP_TABLE_LINKAGE_RESULTS} SELECT * FROM linkage_chunk_table")
     
-    def export_linkage_results_to_csv(self, output_file: str):
+    def export_linkage_results_to_csv(self, output_file: str, output_format: str = DEFAULT_OUTPUT_FORMAT):
         """Exports linkage results from temp table to CSV file.
         
         Args:
             output_file: Path to output CSV file for linkage results
+            output_format: Key of OUTPUT_FORMAT_OPTIONS to write the file as
             
         Raises:
             RuntimeError: If export fails
@@ -181,9 +218,9 @@ class AuthorReferencesRepository:
             
             export_query = f"""
                 COPY (
-                    SELECT * FROM {TEMP_TABLE_LINKAGE_RESULTS}
+                    SELECT {', '.join(LINKAGE_FIELDNAMES)} FROM {TEMP_TABLE_LINKAGE_RESULTS}
                     ORDER BY input_doi, input_work_id, input_author_name
-                ) TO '{safe_output_file}' (HEADER, DELIMITER ',')
+                ) TO '{safe_output_file}' {OUTPUT_FORMAT_OPTIONS[output_format]}
             """
             
             self.db.execute(export_query)
@@ -191,6 +228,46 @@ class AuthorReferencesRepository:
         except Exception as e:
             raise RuntimeError(f"Failed to export linkage results to CSV: {e}")
     
+    def export_entity_mappings_to_csv(self, entity_mappings: list, output_file: str,
+                                      output_format: str = DEFAULT_OUTPUT_FORMAT):
+        """Exports extracted entities to CSV, one row per source affiliation.
+        
+        Args:
+            entity_mappings: (entity_text, source_affiliation) pairs
+            output_file: Path to output CSV file for entity mappings
+            output_format: Key of OUTPUT_FORMAT_OPTIONS to write the file as
+            
+        Raises:
+            RuntimeError: If export fails
+        """
+        try:
+            safe_output_file = sanitize_file_path_for_sql(output_file, is_output=True)
+            
+            entity_texts, source_affiliations = zip(*entity_mappings)
+            mappings_table = pa.table({
+                'entity_text': pa.array(entity_texts, pa.string()),
+                'source_affiliation': pa.array(source_affiliations, pa.string()),
+                'mapping_order': pa.array(range(len(entity_texts)), pa.int64())
+            })
+            self.db.register_arrow('entity_mappings_table', mappings_table)
+            
+            # Rows and the entities within them keep extraction order
+            export_query = f"""
+                COPY (
+                    SELECT 
+                        source_affiliation,
+                        string_agg(entity_text, '; ' ORDER BY mapping_order) AS extracted_entities
+                    FROM entity_mappings_table
+                    GROUP BY source_affiliation
+                    ORDER BY min(mapping_order)
+                ) TO '{safe_output_file}' {OUTPUT_FORMAT_OPTIONS[output_format]}
+            """
+            
+            self.db.execute(export_query)
+            
+        except Exception as e:
+            raise RuntimeError(f"Failed to export entity mappings to CSV: {e}")
+    
     def get_unique_affiliations_for_entity_extraction(self):
         """Get unique org-matched affiliations from temp linkage table for entity extraction.
             
@@ -226,7 +303,7 @@ class AuthorReferencesRepository:
         try:
             placeholders = ', '.join(['?' for _ in normalized_affiliations])
             
-            affiliations_df = self.db.query_df(f"""
+            affiliations_table = self.db.query_arrow(f"""
                 SELECT DISTINCT 
                     normalized_affiliation_name,
                     FIRST(affiliation_name) as original_affiliation
@@ -237,8 +314,8 @@ class AuthorReferencesRepository:
             """, normalized_affiliations)
             
             return dict(zip(
-                affiliations_df['normalized_affiliation_name'],
-                affiliations_df['original_affiliation']
+                affiliations_table.column('normalized_affiliation_name').to_pylist(),
+                affiliations_table.column('original_affiliation').to_pylist()
             ))
             
         except Exception as e:
@@ -259,13 +336,17 @@ class AuthorReferencesRepository:
         try:
             self.db.execute(f"CREATE OR REPLACE TEMP TABLE {TEMP_TABLE_ENTITY_KEYS} (entity_key VARCHAR, source_affiliations VARCHAR)")
 
-            records = []
+            entity_keys = []
+            source_affiliations = []
             for entity, sources in entity_to_sources.items():
-                source_affiliation = sources[0] if isinstance(sources, list) else sources
-                records.append({'entity_key': entity, 'source_affiliations': source_affiliation})
+                entity_keys.append(entity)
+                source_affiliations.append(sources[0] if isinstance(sources, list) else sources)
 
-            entities_df = pd.DataFrame(records)
-            self.db.register_df('entities_df', entities_df)
+            entities_table = pa.table({
+                'entity_key': pa.array(entity_keys, type=pa.string()),
+                'source_affiliations': pa.array(source_affiliations, type=pa.string())
+            })
+            self.db.register_arrow('entities_df', entities_table)
 
             self.db.execute(f"INSERT INTO {TEMP_TABLE_ENTITY_KEYS} SELECT entity_key, source_affiliations FROM entities_df")
             
@@ -294,6 +375,10 @@ class AuthorReferencesRepository:
     
     def discover_works_by_affiliation(self, linkage_table_name: str = TEMP_TABLE_LINKAGE_RESULTS, exclude_ids_view: str = TEMP_VIEW_UNIQUE_IDS):
         try:
+            # One NOT EXISTS per id column: each plans as a hash anti-join,
+            # where an OR in a LEFT JOIN condition is a nested-loop join.
+            # Linkages without an affiliation have an empty key, which would
+            # otherwise join every unaffiliated author in the database.
             query = f"""
             INSERT INTO {TEMP_TABLE_AFFILIATION_DISCOVERED}
             SELECT
@@ -305,12 +390,17 @@ class AuthorReferencesRepository:
                 collab.affiliation_ror AS discovered_ror_id
             FROM {linkage_table_name} AS ld
             JOIN {TABLE_AUTHOR_REFERENCES} AS collab 
-                ON lower(trim(ld.ref_affiliation)) = collab.normalized_affiliation_key
-            LEFT JOIN {exclude_ids_view} AS exclude_ids 
-                ON (collab.doi = exclude_ids.doi AND collab.doi IS NOT NULL AND exclude_ids.doi IS NOT NULL) 
-                OR (CAST(collab.work_id AS VARCHAR) = CAST(exclude_ids.work_id AS VARCHAR) AND collab.work_id IS NOT NULL AND exclude_ids.work_id IS NOT NULL)
+                ON ld.ref_affiliation_key = collab.normalized_affiliation_key
             WHERE (ld.linkage_status = '{STATUS_ORG_MATCH}' OR ld.linkage_status = '{STATUS_FIRST_AVAILABLE}')
-            AND (exclude_ids.doi IS NULL AND exclude_ids.work_id IS NULL)
+            AND ld.ref_affiliation_key != ''
+            AND NOT EXISTS (
+                SELECT 1 FROM {exclude_ids_view} AS exclude_ids
+                WHERE CAST(exclude_ids.doi AS VARCHAR) = collab.doi
+            )
+            AND NOT EXISTS (
+                SELECT 1 FROM {exclude_ids_view} AS exclude_ids
+                WHERE CAST(exclude_ids.work_id AS VARCHAR) = CAST(collab.work_id AS VARCHAR)
+            )
             """
 
             before_count = self.db.query_one(f"SELECT COUNT(*) FROM {TEMP_TABLE_AFFILIATION_DISCOVERED}")
@@ -332,12 +422,9 @@ class AuthorReferencesRepository:
             return 0
         
         try:
-            temp_known_orgs = "temp_known_orgs"
-            self.db.execute(f"CREATE OR REPLACE TEMP TABLE {temp_known_orgs} (name VARCHAR)")
-            
-            for org_name in org_names:
-                escaped_org = org_name.lower().replace("'", "''")
-                self.db.execute(f"INSERT INTO {temp_known_orgs} VALUES (?)", (escaped_org,))
+            # One alternation of all org names: each affiliation key is scanned
+            # once instead of once per org name
+            org_name_pattern = '|'.join(re.escape(org_name.lower()) for org_name in org_names)
 
             self.db.execute(f"""
                 CREATE OR REPLACE TEMP TABLE {TEMP_TABLE_ALREADY_DISCOVERED} AS
@@ -348,8 +435,21 @@ class AuthorReferencesRepository:
                 )
             """)
 
+            # The substring test can't be hashed, so it runs once per distinct
+            # org-matching affiliation key; rows are then found by equality
             entity_discovery_query = f"""
                 CREATE OR REPLACE TEMP TABLE {TEMP_TABLE_ENTITY_DISCOVERED} AS
+                WITH org_affiliation_keys AS (
+                    SELECT DISTINCT normalized_affiliation_key
+                    FROM {TABLE_AUTHOR_REFERENCES}
+                    WHERE regexp_matches(normalized_affiliation_key, ?)
+                ),
+                entity_affiliation_keys AS (
+                    SELECT ek.source_affiliations, ek.entity_key, oak.normalized_affiliation_key
+                    FROM {entity_keys_table} AS ek
+                    JOIN org_affiliation_keys AS oak
+                        ON oak.normalized_affiliation_key LIKE '%' || ek.entity_key || '%'
+                )
                 SELECT DISTINCT
                     ek.source_affiliations AS source_embl_affiliation,
                     ek.entity_key AS extracted_entity,
@@ -359,25 +459,29 @@ class AuthorReferencesRepository:
                     ar.affiliation_name AS discovered_author_affiliation,
                     ar.normalized_affiliation_name AS discovered_normalized_affiliation,
                     ar.affiliation_ror AS discovered_ror_id
-                FROM {entity_keys_table} AS ek
+                FROM entity_affiliation_keys AS ek
                 JOIN {TABLE_AUTHOR_REFERENCES} AS ar 
-                    ON ar.normalized_affiliation_key LIKE '%' || ek.entity_key || '%'
-                    AND EXISTS (
-                        SELECT 1 FROM {temp_known_orgs} AS org_names
-                        WHERE ar.normalized_affiliation_key LIKE '%' || org_names.name || '%'
-                    )
-                LEFT JOIN {TEMP_TABLE_ALREADY_DISCOVERED} adw
-                    ON (CAST(ar.work_id AS VARCHAR) = CAST(adw.discovered_work_id AS VARCHAR) AND ar.work_id IS NOT NULL)
-                    OR (ar.doi = adw.discovered_doi AND ar.doi IS NOT NULL)
-                LEFT JOIN {exclude_ids_view} AS exclude_ids 
-                    ON (ar.doi = exclude_ids.doi AND ar.doi IS NOT NULL AND exclude_ids.doi IS NOT NULL) 
-                    OR (CAST(ar.work_id AS VARCHAR) = CAST(exclude_ids.work_id AS VARCHAR) AND ar.work_id IS NOT NULL AND exclude_ids.work_id IS NOT NULL)
-                WHERE COALESCE(adw.discovered_work_id, adw.discovered_doi) IS NULL
-                AND (exclude_ids.doi IS NULL AND exclude_ids.work_id IS NULL)
+                    ON ar.normalized_affiliation_key = ek.normalized_affiliation_key
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM {TEMP_TABLE_ALREADY_DISCOVERED} adw
+                    WHERE CAST(adw.discovered_work_id AS VARCHAR) = CAST(ar.work_id AS VARCHAR)
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM {TEMP_TABLE_ALREADY_DISCOVERED} adw
+                    WHERE CAST(adw.discovered_doi AS VARCHAR) = ar.doi
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM {exclude_ids_view} AS exclude_ids
+                    WHERE CAST(exclude_ids.doi AS VARCHAR) = ar.doi
+                )
+                AND NOT EXISTS (
+                    SELECT 1 FROM {exclude_ids_view} AS exclude_ids
+                    WHERE CAST(exclude_ids.work_id AS VARCHAR) = CAST(ar.work_id AS VARCHAR)
+                )
                 ORDER BY ar.work_id, ar.doi
             """
             
-            self.db.execute(entity_discovery_query)
+            self.db.execute(entity_discovery_query, [org_name_pattern])
 
             return self.db.query_one(f"SELECT COUNT(*) FROM {TEMP_TABLE_ENTITY_DISCOVERED}")[0]
             
@@ -391,8 +495,8 @@ class AuthorReferencesRepository:
             self.db.execute(f"""
                 CREATE OR REPLACE TEMP TABLE {TEMP_TABLE_ALREADY_DISCOVERED} AS
                 SELECT DISTINCT discovered_work_id, discovered_doi
-                FROM read_csv_auto('{safe_log_file}', HEADER=TRUE, ALL_VARCHAR=TRUE)
-            """)
+                FROM read_csv_auto(?, HEADER=TRUE, ALL_VARCHAR=TRUE)
+            """, [safe_log_file])
         except Exception as e:
             raise RuntimeError(f"Failed to update already discovered table: {e}")
     
@@ -508,6 +612,14 @@ class AuthorReferencesRepository:
                     WHERE priority = 1
                 """
             
+            # Materialized once so the CSV export and the per-type counts
+            # don't each re-run the union and window
+            self.db.execute(f"""
+                CREATE OR REPLACE TEMP TABLE {TEMP_TABLE_COMBINED_DISCOVERED} AS
+                {combined_query}
+            """)
+            combined_query = f"SELECT * FROM {TEMP_TABLE_COMBINED_DISCOVERED}"
+            
             return combined_query, has_standard_discovery, has_entity_discovery
             
         except Exception as e:
@@ -557,14 +669,10 @@ class AuthorReferencesRepository:
                 SELECT entity_text, source_affiliation FROM temp_entities_view
             """)
             
-            orgs_df = pd.DataFrame(organization_names, columns=['org_name'])
-
-            self.db.register_df('temp_orgs_view', orgs_df)
-            
             self.db.execute(f"""
                 INSERT INTO {temp_orgs_table} 
-                SELECT org_name FROM temp_orgs_view
-            """)
+                SELECT UNNEST(?::VARCHAR[])
+            """, [list(organization_names)])
 
             matching_query = f"""
                 SELECT DISTINCT 
@@ -1,13 +1,23 @@
 
 import os
-import csv
+import re
 import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 
 from query_db.analysis.name_matching import are_names_similar
-from query_db.utils import extract_doi, normalize_text, is_likely_acronym
+from query_db.udf import names_similar_mask
+from query_db.utils import extract_doi, normalize_text, is_likely_acronym, substring_trie_pattern
 from query_db.constants import *
 
+# The CSV columns plus the reference row's affiliation join key, carried
+# along so affiliation discovery doesn't recompute it
+LINKAGE_SCHEMA = pa.schema([(name, pa.string()) for name in LINKAGE_FIELDNAMES + ['ref_affiliation_key']])
+
 
 class LinkageService:
     def __init__(self, repository, config):
@@ -19,11 +29,29 @@ class LinkageService:
         self.organization_names = self.config.get('organization_names', [])
         self.normalized_org_names = [normalize_text(
             name) for name in self.organization_names]
+        # One trie-shaped pattern scans each affiliation once for all org
+        # names; a flat alternation retries every name at every position
+        self.org_name_pattern = re.compile(
+            substring_trie_pattern(self.normalized_org_names))
         self.input_name_style = self.config.get('input_name_style', 'auto')
         self.reference_name_style = self.config.get(
             'reference_name_style', 'first_last')
         self.matching_threshold = self.config.get(
             'name_matching_threshold', DEFAULT_NAME_THRESHOLD)
+        self.name_matching_workers = self.config.get('name_matching_workers', 1)
+        self.executor = None
+        if self.name_matching_workers > 1:
+            # The name UDF runs under the GIL inside DuckDB, so with workers
+            # the candidate pairs are fetched unfiltered and their batches
+            # are matched in parallel processes instead
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.name_matching_workers,
+                mp_context=multiprocessing.get_context('spawn'))
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown()
+            self.executor = None
 
     def find_linkages_udf(self, chunk_df, input_doi_col=None, input_work_id_col=None,
                           authors_col=None, author_sep=''):
@@ -31,7 +59,7 @@ class LinkageService:
             raise ValueError("authors_col parameter is required")
 
         try:
-            matched_results = self.repository.query_authors_for_linkage_udf(
+            match_reader = self.repository.query_authors_for_linkage_udf(
                 chunk_df=chunk_df,
                 input_doi_col=input_doi_col,
                 input_work_id_col=input_work_id_col,
@@ -39,39 +67,69 @@ class LinkageService:
                 author_sep=author_sep,
                 input_name_style=self.input_name_style,
                 reference_name_style=self.reference_name_style,
-                name_threshold=self.matching_threshold
+                name_threshold=self.matching_threshold,
+                filter_names=self.executor is None
             )
 
-            matches_in_chunk = []
-
-            for row in matched_results:
-                input_doi, input_work_id, input_author, ref_author_name, ref_affiliation = row
-
-                status = self._determine_linkage_status(ref_affiliation)
+            if self.executor:
+                match_reader = self._match_names_in_workers(match_reader)
 
-                matches_in_chunk.append({
-                    'input_doi': input_doi or '',
-                    'input_work_id': input_work_id or '',
-                    'input_author_name': input_author.strip() if input_author else '',
-                    'ref_author_name': ref_author_name or '',
-                    'ref_affiliation': ref_affiliation or '',
-                    'linkage_status': status
-                })
-
-            return matches_in_chunk
+            match_batches = [self._linkage_batch(batch) for batch in match_reader]
+            return pa.Table.from_batches(match_batches, schema=LINKAGE_SCHEMA)
 
         except Exception as e:
             raise RuntimeError(f"Failed to find linkages using UDF: {e}")
 
+    def _match_names_in_workers(self, candidate_reader):
+        # Batches are submitted as they are read, with at most two per worker
+        # in flight, so a chunk's unfiltered candidates are never all held
+        # in memory at once; filtered batches come back in reader order
+        max_in_flight = 2 * self.name_matching_workers
+        in_flight = deque()
+        for batch in candidate_reader:
+            in_flight.append((batch, self.executor.submit(
+                names_similar_mask,
+                batch.column('input_author'),
+                batch.column('ref_author_name'),
+                self.input_name_style,
+                self.reference_name_style,
+                self.matching_threshold
+            )))
+            if len(in_flight) >= max_in_flight:
+                batch, mask = in_flight.popleft()
+                yield batch.filter(mask.result())
+        
+        while in_flight:
+            batch, mask = in_flight.popleft()
+            yield batch.filter(mask.result())
+
+    def _linkage_batch(self, batch):
+        # Columns stay in Arrow; only the status needs Python, once per
+        # distinct affiliation in the batch
+        ref_affiliations = batch.column('ref_affiliation').to_pylist()
+        statuses = {affiliation: self._determine_linkage_status(affiliation)
+                    for affiliation in set(ref_affiliations)}
+
+        def as_text(column):
+            return pc.fill_null(pc.cast(batch.column(column), pa.string()), '')
+
+        return pa.record_batch([
+            as_text('input_doi'),
+            as_text('input_work_id'),
+            pc.utf8_trim_whitespace(as_text('input_author')),
+            as_text('ref_author_name'),
+            as_text('ref_affiliation'),
+            pa.array([statuses[affiliation] for affiliation in ref_affiliations], pa.string()),
+            as_text('ref_affiliation_key')
+        ], schema=LINKAGE_SCHEMA)
+
     def _determine_linkage_status(self, affiliation):
         if not self.organization_names or not self.normalized_org_names:
             return STATUS_FIRST_AVAILABLE
 
         if affiliation:
-            normalized_affiliation = normalize_text(affiliation)
-            for org_name in self.normalized_org_names:
-                if org_name in normalized_affiliation:
-                    return STATUS_ORG_MATCH
+            if self.org_name_pattern.search(normalize_text(affiliation)):
+                return STATUS_ORG_MATCH
 
         return STATUS_NAME_MATCH_NO_ORG
 
@@ -2,13 +2,14 @@
 import logging
 from typing import Optional
 
+import pyarrow as pa
 from rapidfuzz import fuzz
-from query_db.analysis.name_matching import are_names_similar
+from query_db.analysis.name_matching import parse_name_by_style, are_parsed_names_similar
 
 logger = logging.getLogger(__name__)
 
 
-def are_names_similar_udf(
+def _are_names_similar_or_false(
     name1: Optional[str], 
     name2: Optional[str], 
     name1_style: str, 
@@ -22,12 +23,10 @@ def are_names_similar_udf(
         if not name1.strip() or not name2.strip():
             return False
         
-        return are_names_similar(
-            name1_str=name1,
-            name2_str=name2,
-            name1_style=name1_style,
-            name2_style=name2_style,
-            threshold=threshold
+        return are_parsed_names_similar(
+            parse_name_by_style(name1, name1_style),
+            parse_name_by_style(name2, name2_style),
+            threshold
         )
     
     except Exception as e:
@@ -40,6 +39,42 @@ def are_names_similar_udf(
         return False
 
 
+def are_names_similar_udf(
+    name1: pa.Array,
+    name2: pa.Array,
+    name1_style: pa.Array,
+    name2_style: pa.Array,
+    threshold: pa.Array
+) -> pa.Array:
+    # Arrow UDF: called once per DuckDB vector rather than once per row;
+    # rows with a NULL argument are filtered out by DuckDB beforehand
+    results = [
+        _are_names_similar_or_false(n1, n2, s1, s2, t)
+        for n1, n2, s1, s2, t in zip(
+            name1.to_pylist(), name2.to_pylist(),
+            name1_style.to_pylist(), name2_style.to_pylist(),
+            threshold.to_pylist()
+        )
+    ]
+    return pa.array(results, type=pa.bool_())
+
+
+def names_similar_mask(
+    names1: pa.Array,
+    names2: pa.Array,
+    name1_style: str,
+    name2_style: str,
+    threshold: float
+) -> pa.Array:
+    # are_names_similar_udf with the styles and threshold fixed, for callers
+    # that filter candidate batches outside DuckDB
+    results = [
+        _are_names_similar_or_false(n1, n2, name1_style, name2_style, threshold)
+        for n1, n2 in zip(names1.to_pylist(), names2.to_pylist())
+    ]
+    return pa.array(results, type=pa.bool_())
+
+
 def partial_ratio_udf(str1: Optional[str], str2: Optional[str]) -> float:
     try:
         if str1 is None or str2 is None:
@@ -72,7 +107,8 @@ def register_name_matching_udf(db_manager) -> None:
             name='are_names_similar_udf',
             func=are_names_similar_udf,
             arg_types=['VARCHAR', 'VARCHAR', 'VARCHAR', 'VARCHAR', 'DOUBLE'],
-            return_type='BOOLEAN'
+            return_type='BOOLEAN',
+            udf_type='arrow'
         )
         
         logger.info("Successfully registered are_names_similar_udf")
@@ -1,46 +1,94 @@
 import re
 import os
 import logging
+from functools import lru_cache
 from unidecode import unidecode
 
 logger = logging.getLogger(__name__)
 
+_PUNCT_RE = re.compile(r'[^\w\s]')
+
+
+class _UnidecodeTable(dict):
+    """str.translate table filled in from unidecode one codepoint at a time.
+    
+    unidecode transliterates character by character, so translating with
+    this table gives the same result with the lookups done in C.
+    """
+    def __missing__(self, codepoint):
+        self[codepoint] = replacement = unidecode(chr(codepoint))
+        return replacement
+
+
+_UNIDECODE_TABLE = _UnidecodeTable()
+
+# Checked in order against the lowercased text; the first match is stripped
+_DOI_URL_PREFIXES = (
+    'https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/',
+    'http://dx.doi.org/', 'https://www.doi.org/', 'http://www.doi.org/',
+    'doi.org/', 'dx.doi.org/', 'www.doi.org/', 'doi:',
+)
+_DOI_RE = re.compile(r'^(10\.\d{4,}(?:\.\d+)?/[-._;()\/:a-zA-Z0-9]+)(?:\s|$)')
+
 
 def is_latin_char_text(text):
-    if not isinstance(text, str):
+    if not isinstance(text, str) or not text:
         return False
-    for char in text:
-        if '\u0000' <= char <= '\u024F':
-            return True
-    return False
+    # True if any character is in the Latin range; min() scans in C
+    return min(text) <= '\u024F'
 
 
+# Reference affiliations repeat across linkage rows, so results are memoized
+@lru_cache(maxsize=131072)
 def normalize_text(text):
     if not isinstance(text, str):
         return text
-    if is_latin_char_text(text):
-        text = unidecode(text)
+    # unidecode leaves ASCII unchanged, and isascii() is a single C scan
+    if not text.isascii() and is_latin_char_text(text):
+        text = text.translate(_UNIDECODE_TABLE)
     text = text.lower()
-    text = re.sub(r'[^\w\s]', '', text)
+    text = _PUNCT_RE.sub('', text)
     text = text.strip()
     return text
 
 
+def substring_trie_pattern(words):
+    """Regex matching wherever any of `words` occurs, for use with search().
+    
+    The words are merged into a prefix trie, so at each position the regex
+    engine follows a single branch per character instead of trying every
+    word in turn as it does for a flat alternation.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    
+    if not trie:
+        return '(?!)'
+    
+    def build(node):
+        # A word ending here is already a match; longer words through this
+        # node don't change whether search() finds one
+        if '' in node:
+            return ''
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items())]
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+    
+    return build(trie)
+
+
 def extract_doi(text):
     if not text or not isinstance(text, str):
         return None
     
     text = text.strip().strip('<>').strip('"').strip("'")
     
-    url_prefixes = [
-        'https://doi.org/', 'http://doi.org/', 'https://dx.doi.org/',
-        'http://dx.doi.org/', 'https://www.doi.org/', 'http://www.doi.org/',
-        'doi.org/', 'dx.doi.org/', 'www.doi.org/', 'doi:', 'DOI:',
-    ]
-    
     text_lower = text.lower()
-    for prefix in url_prefixes:
-        if text_lower.startswith(prefix.lower()):
+    for prefix in _DOI_URL_PREFIXES:
+        if text_lower.startswith(prefix):
             text = text[len(prefix):]
             break
     
@@ -48,8 +96,7 @@ def extract_doi(text):
     if '#' in text: text = text.split('#')[0]
     text = text.strip()
     
-    doi_pattern = r'^(10\.\d{4,}(?:\.\d+)?/[-._;()\/:a-zA-Z0-9]+)(?:\s|$)'
-    match = re.match(doi_pattern, text)
+    match = _DOI_RE.match(text)
     if match:
         return match.group(1).strip()
     
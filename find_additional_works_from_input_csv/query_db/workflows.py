@@ -1,5 +1,4 @@
 import os
-import csv
 import sys
 import pandas as pd
 import logging
@@ -16,10 +15,12 @@ logger = logging.getLogger(__name__)
 
 
 class FileProcessor:
-    def __init__(self, db_manager: DatabaseManager, config: dict, entity_extractor: EntityExtractor = None):
+    def __init__(self, db_manager: DatabaseManager, config: dict, entity_extractor: EntityExtractor = None,
+                 output_format: str = DEFAULT_OUTPUT_FORMAT):
         self.db = db_manager
         self.config = config
         self.entity_extractor = entity_extractor
+        self.output_format = output_format
         
         logger.info("Registering UDFs for FileProcessor")
         register_all_udfs(db_manager)
@@ -64,10 +65,10 @@ class FileProcessor:
             sys.exit(1)
         
         base_path, _ = os.path.splitext(output_file)
-        self.linkage_output_file = f"{base_path}{LINKAGE_SUFFIX}"
+        self.linkage_output_file = self._output_path(base_path, LINKAGE_SUFFIX)
         self.full_log_output_file = f"{base_path}{FULL_LOG_SUFFIX}"
-        self.discovery_output_file = f"{base_path}{DISCOVERED_WORKS_SUFFIX}"
-        self.entity_mappings_file = f"{base_path}{ENTITY_MAPPINGS_SUFFIX}"
+        self.discovery_output_file = self._output_path(base_path, DISCOVERED_WORKS_SUFFIX)
+        self.entity_mappings_file = self._output_path(base_path, ENTITY_MAPPINGS_SUFFIX)
         
         for f in [self.linkage_output_file, self.discovery_output_file, self.entity_mappings_file]:
             if os.path.exists(f):
@@ -78,7 +79,10 @@ class FileProcessor:
         
         try:
             self._prescan_ids(input_file)
-            self._process_linkages(input_file)
+            try:
+                self._process_linkages(input_file)
+            finally:
+                self.linkage_service.close()
             
             entity_mappings = {}
             if self.entity_extraction_enabled and self.entity_extractor and self.organization_names:
@@ -99,6 +103,11 @@ class FileProcessor:
             traceback.print_exc()
             sys.exit(1)
     
+    def _output_path(self, base_path: str, suffix: str):
+        # The suffixes name .csv files; other formats swap in their own extension
+        suffix_stem, _ = os.path.splitext(suffix)
+        return f"{base_path}{suffix_stem}.{self.output_format}"
+    
     def _prescan_ids(self, input_file: str):
         print("Pre-scanning input file for all DOIs and Work IDs...")
         
@@ -114,7 +123,11 @@ class FileProcessor:
         
         self.repository.create_linkage_results_table()
         
-        chunk_reader = pd.read_csv(input_file, chunksize=self.chunk_size, dtype=str, keep_default_na=False)
+        # Only the id and author columns are used; skipping the rest at parse
+        # time saves converting and holding every other input column
+        linkage_cols = {self.input_doi_col, self.input_work_id_col, self.authors_col}
+        chunk_reader = pd.read_csv(input_file, chunksize=self.chunk_size, dtype=str, keep_default_na=False,
+                                   usecols=lambda col: col in linkage_cols)
         for i, chunk_df in enumerate(chunk_reader):
             print(f"  Processing chunk {i+1}...")
             
@@ -162,21 +175,8 @@ class FileProcessor:
         print(f"Extracted {len(entity_mappings)} entity-affiliation pairs.")
         
         if entity_mappings:
-            affiliation_entities = {}
-            for entity_text, source_affiliation in entity_mappings:
-                if source_affiliation not in affiliation_entities:
-                    affiliation_entities[source_affiliation] = []
-                affiliation_entities[source_affiliation].append(entity_text)
-            
-            with open(self.entity_mappings_file, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=['source_affiliation', 'extracted_entities'])
-                writer.writeheader()
-                
-                for affiliation, entities in affiliation_entities.items():
-                    writer.writerow({
-                        'source_affiliation': affiliation,
-                        'extracted_entities': '; '.join(entities)
-                    })
+            self.repository.export_entity_mappings_to_csv(
+                entity_mappings, self.entity_mappings_file, self.output_format)
             
             print(f"  Entity mappings saved to '{self.entity_mappings_file}'")
             print(f"  Using extracted entities for discovery.")
@@ -205,8 +205,8 @@ class FileProcessor:
     def _combine_results(self):
         print(f"\nGenerating combined discovered works list with match types...")
         
-        print("Exporting linkage results to CSV...")
-        self.repository.export_linkage_results_to_csv(self.linkage_output_file)
+        print("Exporting linkage results...")
+        self.repository.export_linkage_results_to_csv(self.linkage_output_file, self.output_format)
         
         combined_query, has_affiliation, has_entity = self.discovery_service.combine_and_deduplicate(None)
         
@@ -220,7 +220,7 @@ class FileProcessor:
         COPY (
             SELECT DISTINCT * FROM ({combined_query})
             ORDER BY match_type, doi, author
-        ) TO '{safe_discovery_output_file}' (HEADER, DELIMITER ',');
+        ) TO '{safe_discovery_output_file}' {OUTPUT_FORMAT_OPTIONS[self.output_format]};
         """
         self.db.execute(sql_query_combined_works)
         
@@ -246,9 +246,10 @@ class FileProcessor:
 
 class AffiliationSearchProcessor:
     
-    def __init__(self, db_manager: DatabaseManager, config: dict):
+    def __init__(self, db_manager: DatabaseManager, config: dict, output_format: str = DEFAULT_OUTPUT_FORMAT):
         self.db = db_manager
         self.config = config
+        self.output_format = output_format
     
     def run(self, input_file: str, output_file: str):
         print(f"--- Running in Batch Affiliation Search Mode ---")
@@ -272,26 +273,40 @@ class AffiliationSearchProcessor:
             safe_input_file = sanitize_file_path_for_sql(input_file, is_output=False)
             safe_output_file = sanitize_file_path_for_sql(output_file, is_output=True)
             
-            sql_query = f"""
+            sql_query = rf"""
             COPY (
                 WITH input_data AS (
-                    SELECT *, normalize_affiliation_udf("{escaped_search_col}") AS normalized_search_key
-                    FROM read_csv_auto('{safe_input_file}', HEADER=TRUE, ALL_VARCHAR=TRUE)
+                    SELECT "{escaped_search_col}" AS search_term
+                    FROM read_csv_auto(?, HEADER=TRUE, ALL_VARCHAR=TRUE)
+                ),
+                -- Search terms repeat across rows, so each distinct term is normalized once.
+                -- Printable ASCII needs no transliteration, and for it normalize_text reduces
+                -- to the SQL expression; only the remaining terms go through the Python UDF
+                normalized_terms AS (
+                    SELECT
+                        search_term,
+                        CASE
+                            WHEN regexp_full_match(search_term, '[ -~]*')
+                            THEN trim(regexp_replace(lower(search_term), '[^\w\s]', '', 'g'))
+                            ELSE normalize_affiliation_udf(search_term)
+                        END AS normalized_search_key
+                    FROM (SELECT DISTINCT search_term FROM input_data)
                 )
                 SELECT
-                    inp."{escaped_search_col}" AS input_search_term,
+                    inp.search_term AS input_search_term,
                     ref.work_id AS ref_work_id, ref.doi AS ref_doi,
                     ref.author_name AS ref_author_name,
                     ref.normalized_affiliation_name AS ref_affiliation,
                     ref.normalized_affiliation_key AS ref_affiliation_normalized_key
                 FROM {TABLE_AUTHOR_REFERENCES} AS ref 
-                JOIN input_data AS inp ON ref.normalized_affiliation_key = inp.normalized_search_key
+                JOIN normalized_terms AS norm ON ref.normalized_affiliation_key = norm.normalized_search_key
+                JOIN input_data AS inp ON inp.search_term = norm.search_term
                 ORDER BY input_search_term, ref.doi, ref.author_name
-            ) TO '{safe_output_file}' (HEADER, DELIMITER ',');
+            ) TO '{safe_output_file}' {OUTPUT_FORMAT_OPTIONS[self.output_format]};
             """
             
             print(f"Searching for affiliations from '{input_file}'...")
-            self.db.execute(sql_query)
+            self.db.execute(sql_query, [safe_input_file])
             print(f"Search complete. Enriched results saved to '{output_file}'.")
             
         except Exception as e:
@@ -0,0 +1,32 @@
+import unittest
+
+from rapidfuzz.distance import JaroWinkler
+
+from query_db.analysis.name_matching import jaro_winkler_upper_bound
+
+
+class JaroWinklerUpperBoundTest(unittest.TestCase):
+
+    def test_rejects_very_different_lengths_at_default_threshold(self):
+        self.assertLess(jaro_winkler_upper_bound(1, 5), 0.85)
+        self.assertLess(jaro_winkler_upper_bound(5, 1), 0.85)
+
+    def test_keeps_similar_lengths_at_default_threshold(self):
+        self.assertGreaterEqual(jaro_winkler_upper_bound(5, 6), 0.85)
+        self.assertEqual(jaro_winkler_upper_bound(4, 4), 1.0)
+
+    def test_bound_is_reached_but_not_exceeded(self):
+        # A shared four-character prefix with the shorter string fully
+        # contained gets the largest score possible for these lengths
+        pairs = [("abcd", "abcdxy"), ("smith", "smithson")]
+        for s1, s2 in pairs:
+            score = JaroWinkler.normalized_similarity(s1, s2)
+            self.assertAlmostEqual(score, jaro_winkler_upper_bound(len(s1), len(s2)))
+
+        for s1, s2 in [("martin", "martinez"), ("lee", "li"), ("wang", "wong"), ("jo", "johanna")]:
+            score = JaroWinkler.normalized_similarity(s1, s2)
+            self.assertLessEqual(score, jaro_winkler_upper_bound(len(s1), len(s2)) + 1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()